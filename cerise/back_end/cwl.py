@@ -1,19 +1,29 @@
-import yaml
+from cerise.parsing import load_yaml
 from cerise.job_store.job_state import JobState
 
-def is_workflow(workflow_content):
-    """Takes CWL file contents and checks whether it is a CWL Workflow
+def parse_workflow(workflow_content):
+    """Parses CWL file contents into a dict structure.
+
+    Args:
+        workflow_content (bytes): The contents of a CWL file.
+
+    Returns:
+        Dict: The parsed CWL document.
+    """
+    return load_yaml(workflow_content)
+
+def is_workflow(workflow):
+    """Takes a parsed CWL file and checks whether it is a CWL Workflow
     (and not an ExpressionTool or CommandLineTool).
 
     Args:
-        workflow_content (bytes): a dict structure parsed from a CWL
+        workflow (Dict): a dict structure parsed from a CWL
                 file.
 
     Returns:
         bool: True iff the top-level Process in this CWL file is an
                 instance of Workflow.
     """
-    workflow = yaml.safe_load(workflow_content)
     process_class = workflow.get('class')
     return process_class == 'Workflow'
 
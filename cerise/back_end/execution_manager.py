@@ -1,4 +1,5 @@
 from cerise.job_store.sqlite_job_store import SQLiteJobStore
+from cerise.job_store.job_event import JobEvent
 from cerise.job_store.job_state import JobState
 from .cwl import get_cwltool_result
 from .cwl import is_workflow
@@ -6,10 +7,22 @@ from .local_files import LocalFiles
 from .xenon_remote_files import XenonRemoteFiles
 from .xenon_job_runner import XenonJobRunner
 
+from concurrent.futures import ThreadPoolExecutor
+import jpype
+import json
 import logging
+import threading
 import time
 import traceback
 
+_destaged_events = {
+        JobState.SUCCESS: JobEvent.DESTAGED_SUCCESS,
+        JobState.TEMPORARY_FAILURE: JobEvent.DESTAGED_TEMPORARY_FAILURE,
+        JobState.PERMANENT_FAILURE: JobEvent.DESTAGED_PERMANENT_FAILURE,
+        JobState.SYSTEM_ERROR: JobEvent.DESTAGED_SYSTEM_ERROR}
+"""Dict[JobState, JobEvent]: The event for each possible result of a
+job, to be applied once its output has been destaged."""
+
 class ExecutionManager:
     """Handles the execution of jobs on the remote resource.
     The execution manager monitors the job store for files that are
@@ -34,7 +47,7 @@ class ExecutionManager:
         self._shutting_down = False
 
         # _job_store = InMemoryJobStore()
-        self._job_store = SQLiteJobStore(config['database']['file'])
+        self._job_store = SQLiteJobStore.from_config(config['database'])
         """SQLiteJobStore: The job store to use."""
         self._local_files = LocalFiles(self._job_store, config['client-file-exchange'])
         """LocalFiles: The local files manager."""
@@ -42,6 +55,17 @@ class ExecutionManager:
         """RemoteFiles: The remote files manager."""
         self._remote_refresh = api_config['compute-resource'].get('refresh', 2)
 
+        workers_config = api_config['compute-resource'].get('workers', {})
+        self._workers = {
+                activity: ThreadPoolExecutor(max_workers=workers_config.get(activity, default))
+                for activity, default in [
+                    ('stage-in', 4), ('start', 1), ('destage', 4), ('delete', 1)]}
+        """Dict[str, ThreadPoolExecutor]: Worker threads, by activity."""
+        self._active_jobs = set()
+        """Set[str]: Ids of jobs that a worker thread is busy with."""
+        self._active_jobs_lock = threading.Lock()
+        """Lock protecting _active_jobs."""
+
         api_install_script_path, api_files_path = self._remote_files.stage_api(apidir)
 
         # TODO: recover database from crash
@@ -85,98 +109,239 @@ class ExecutionManager:
             job.state = JobState.RUNNING_CR
         else:
             job.state = JobState.CANCELLED
+            self._remote_files.forget_job(job_id)
 
-    def _stage_and_start_job(self, job_id, job):
+    def _stage_job(self, job_id, job):
         try:
             input_files = self._local_files.resolve_input(job_id)
         except FileNotFoundError:
             job.state = JobState.PERMANENT_FAILURE
-            return
+            return None
 
-        if not is_workflow(job.workflow_content):
+        if not is_workflow(json.loads(job.workflow_json)):
             job.state = JobState.PERMANENT_FAILURE
-            return
+            return None
 
-        if job.try_transition(JobState.STAGING_IN_CR, JobState.CANCELLED):
+        if job.apply_event(JobEvent.ABORT_STAGING_IN):
             self._logger.debug('Job was cancelled while resolving input')
-            return
-        self._remote_files.stage_job(job_id, input_files)
+            return None
+        try:
+            self._remote_files.stage_job(job_id, input_files)
+        except FileNotFoundError:
+            # http:// inputs are only requested while they are staged
+            job.state = JobState.PERMANENT_FAILURE
+            return None
+        return 'start', self._start_job
+
+    def _start_job(self, job_id, job):
+        if job.apply_event(JobEvent.ABORT_STAGING_IN):
+            self._logger.debug('Job was cancelled while staging')
+            return None
         self._job_runner.start_job(job_id)
-        if not (job.try_transition(JobState.STAGING_IN, JobState.WAITING) or
-                job.try_transition(JobState.STAGING_IN_CR, JobState.WAITING_CR)):
+        if not job.apply_event(JobEvent.START):
             job.state = JobState.SYSTEM_ERROR
+        self._logger.debug('Staged and started job')
+        return None
 
     def _destage_job(self, job_id, job):
         result = get_cwltool_result(job.log)
 
-        if job.try_transition(JobState.FINISHED, JobState.STAGING_OUT):
-            output_files = self._remote_files.destage_job_output(job_id)
-            self._local_files.publish_job_output(job_id, output_files)
+        output_files = self._remote_files.destage_job_output(job_id)
+        self._local_files.publish_job_output(job_id, output_files)
+
+        if not job.apply_event(_destaged_events[result]):
+            job.state = JobState.SYSTEM_ERROR
+        return None
+
+    def _submit_task(self, activity, job_id, task):
+        """Have a worker thread perform a task for a job.
+
+        While the task is queued or running, the job is not looked
+        at by _process_jobs().
+
+        Args:
+            activity (str): The kind of activity, which selects the
+                pool of worker threads to use.
+            job_id (str): The id of the job to work on.
+            task (Callable[[str, SQLiteJob], Union[Tuple[str, Callable], NoneType]]):
+                A function taking the job id and the job, and
+                returning either None, or an activity and a task to
+                do next for this job.
+        """
+        with self._active_jobs_lock:
+            self._active_jobs.add(job_id)
+        self._workers[activity].submit(self._run_task, job_id, task)
+
+    def _run_task(self, job_id, task):
+        """Perform a task for a job, in a worker thread.
+
+        Args:
+            job_id (str): The id of the job to work on.
+            task (Callable): The task to perform, see _submit_task().
+        """
+        next_task = None
+        try:
+            if self._shutting_down:
+                # Leave it, recovery on start-up will take care of it
+                return
+
+            if not jpype.isThreadAttachedToJVM():
+                jpype.attachThreadToJVM()
 
-            if not (job.try_transition(JobState.STAGING_OUT, result) or
-                    job.try_transition(JobState.STAGING_OUT_CR, JobState.CANCELLED)):
-                job.state = JobState.SYSTEM_ERROR
+            with self._job_store:
+                job = self._job_store.get_job(job_id)
+                if job is None:
+                    return
+                try:
+                    next_task = task(job_id, job)
+                except:
+                    job.state = JobState.SYSTEM_ERROR
+                    self._logger.critical('An internal error occurred when processing job ' + job_id)
+                    self._logger.critical(traceback.format_exc())
+        except:
+            # Something outside of the task failed, e.g. committing its
+            # changes, so the job may be left in an active state that
+            # _process_jobs() does not look at.
+            next_task = None
+            self._logger.critical('An internal error occurred when processing job ' + job_id)
+            self._logger.critical(traceback.format_exc())
+            self._set_system_error(job_id)
+        finally:
+            if next_task is not None and not self._shutting_down:
+                self._workers[next_task[0]].submit(self._run_task, job_id, next_task[1])
+            else:
+                with self._active_jobs_lock:
+                    self._active_jobs.discard(job_id)
+
+    def _set_system_error(self, job_id):
+        """Put a job into SYSTEM_ERROR, in a unit of work of its own.
+
+        Args:
+            job_id (str): The id of the job that failed.
+        """
+        try:
+            with self._job_store:
+                job = self._job_store.get_job(job_id)
+                if job is not None:
+                    job.state = JobState.SYSTEM_ERROR
+        except:
+            self._logger.critical('Could not set job ' + job_id + ' to SystemError')
+            self._logger.critical(traceback.format_exc())
 
     def _process_jobs(self, check_remote):
         """
-        Go through the jobs and do what needs to be done.
+        Go through the jobs that need attention and do what needs
+        to be done.
+
+        Quick activities are done right away, while staging and
+        deletion are handed off to worker threads.
 
         Args:
             check_remote (boolean): Whether to access the remote
                 compute resource to check on jobs.
         """
-        jobs = self._job_store.list_jobs()
-        for job_id in [job.id for job in jobs]:
+        active_states = [JobState.SUBMITTED, JobState.FINISHED]
+        active_states += [state for state in JobState
+                          if JobState.cancellation_active(state)]
+        if check_remote:
+            active_states += [state for state in JobState
+                              if JobState.is_remote(state)]
+        final_states = [state for state in JobState if JobState.is_final(state)]
+
+        with self._job_store:
+            jobs = self._job_store.list_jobs(states=active_states)
+            jobs += self._job_store.list_jobs(
+                    states=final_states, please_delete=True)
+            job_ids = [job.id for job in jobs]
+            remote_job_ids = {job.id for job in jobs if JobState.is_remote(job.state)}
+
+        with self._active_jobs_lock:
+            remote_job_ids -= self._active_jobs
+
+        if check_remote and remote_job_ids:
+            self._logger.debug('Checking remote state')
+            try:
+                self._job_runner.update_jobs(list(remote_job_ids))
+            except:
+                self._logger.critical('An internal error occurred when updating remote jobs')
+                self._logger.critical(traceback.format_exc())
+
+        for job_id in job_ids:
             if self._shutting_down:
                 break
 
-            try:
-                job = self._job_store.get_job(job_id)
-                self._logger.debug('Processing job ' + job_id + ' with current state ' + job.state.value)
+            with self._active_jobs_lock:
+                if job_id in self._active_jobs:
+                    continue
 
-                if check_remote and JobState.is_remote(job.state):
-                    self._logger.debug('Checking remote state')
-                    self._job_runner.update_job(job_id)
-                    self._remote_files.update_job(job_id)
+            # Each job is processed in its own unit of work, so that
+            # its changes are committed once, and before moving on.
+            # If committing fails, e.g. because the database is locked,
+            # the job is left as it was, and tried again next time.
+            try:
+                with self._job_store:
                     job = self._job_store.get_job(job_id)
+                    if job is None:
+                        continue
 
-                if job.state == JobState.FINISHED:
-                    self._destage_job(job_id, job)
+                    try:
+                        self._logger.debug('Processing job ' + job_id + ' with current state ' + job.state.value)
 
-                if job.try_transition(JobState.SUBMITTED, JobState.STAGING_IN):
-                    self._stage_and_start_job(job_id, job)
-                    self._logger.debug('Staged and started job')
+                        if check_remote and job_id in remote_job_ids:
+                            self._remote_files.update_job(job_id)
 
-                if JobState.cancellation_active(job.state):
-                    self._cancel_job(job_id, job)
+                        if job.apply_event(JobEvent.PICK_UP):
+                            if job.state == JobState.STAGING_OUT:
+                                self._submit_task('destage', job_id, self._destage_job)
+                            else:
+                                self._submit_task('stage-in', job_id, self._stage_job)
+                            continue
 
-                self._logger.debug('State is now ' + job.state.value)
+                        if JobState.cancellation_active(job.state):
+                            self._cancel_job(job_id, job)
 
-                if job.please_delete and JobState.is_final(job.state):
-                    self._delete_job(job_id, job)
+                        self._logger.debug('State is now ' + job.state.value)
+
+                        if job.please_delete and JobState.is_final(job.state):
+                            self._submit_task('delete', job_id, self._delete_job)
+                    except:
+                        job.state = JobState.SYSTEM_ERROR
+                        self._logger.critical('An internal error occurred when processing job ' + job.id)
+                        self._logger.critical(traceback.format_exc())
             except:
-                job.state = JobState.SYSTEM_ERROR
-                self._logger.critical('An internal error occurred when processing job ' + job.id)
+                self._logger.critical('An internal error occurred when processing job ' + job_id)
                 self._logger.critical(traceback.format_exc())
 
     def execute_jobs(self):
         """Run the main backend execution loop.
         """
-        with self._job_store:
-            last_active = time.perf_counter() - self._remote_refresh - 1
-            while not self._shutting_down:
-                now = time.perf_counter()
-                check_remote = now - last_active > self._remote_refresh
+        last_active = time.perf_counter() - self._remote_refresh - 1
+        while not self._shutting_down:
+            now = time.perf_counter()
+            check_remote = now - last_active > self._remote_refresh
 
-                self._process_jobs(check_remote)
-                if check_remote:
-                    last_active = time.perf_counter()
+            # Read the counter before processing, so that changes made
+            # while we're busy will wake us up again immediately.
+            with self._job_store:
+                change_count = self._job_store.get_change_count()
 
-                try:
-                    # Handler in run_back_end throws KeyboardInterrupt in order to
-                    # break the sleep call; catch it to exit gracefully
-                    time.sleep(0.1)
-                except KeyboardInterrupt:
-                    pass
+            self._process_jobs(check_remote)
+            if check_remote:
+                last_active = time.perf_counter()
+
+            try:
+                # Handler in run_back_end throws KeyboardInterrupt in order to
+                # break the wait; catch it to exit gracefully
+                next_refresh = last_active + self._remote_refresh - time.perf_counter()
+                self._job_store.wait_for_change(change_count, max(next_refresh, 0.0))
+            except KeyboardInterrupt:
+                pass
 
         self._logger.info('Back-end shutting down')
+        for workers in self._workers.values():
+            while True:
+                try:
+                    workers.shutdown(wait=True)
+                    break
+                except KeyboardInterrupt:
+                    pass    # keep waiting for running tasks
@@ -1,14 +1,25 @@
 from .cwl import get_files_from_binding
+from .cwl import parse_workflow
+from .lru_cache import LRUCache
 
 from cerise.job_store.job_state import JobState
 
+import hashlib
 import json
 import logging
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 import shutil
 import urllib
 
+_chunk_size = 1024 * 1024
+"""int: The size of the chunks to read input files in, in bytes."""
+
+_workflow_cache_size = 100
+"""int: The maximum number of workflows to keep in memory."""
+
 class LocalFiles:
     def __init__(self, job_store, local_config):
         """Create a LocalFiles object.
@@ -20,6 +31,12 @@ class LocalFiles:
         latter a str with a base URL (file or http) describing the way the
         user sees this location.
 
+        Inputs given as http:// URLs are downloaded through a pool of
+        persistent connections. The optional keys 'http-timeout' and
+        'http-retries' set the timeout in seconds for connecting and
+        for waiting for data, and the number of times to retry a
+        failed request or resume an interrupted download.
+
         Args:
             local_config (Dict): A dict containing key-value pairs with
                 local configuration.
@@ -35,6 +52,25 @@ class LocalFiles:
         self._baseurl = local_config['store-location-client']
         """str: The externally accessible base URL corresponding to the _basedir."""
 
+        self._http_timeout = local_config.get('http-timeout', 30.0)
+        """float: Timeout for HTTP connections and reads, in seconds."""
+
+        self._http_retries = local_config.get('http-retries', 3)
+        """int: Number of times to retry or resume an HTTP request."""
+
+        # Once the retries are used up, return the last response rather
+        # than raising RetryError, so that a persistent server error is
+        # reported as a missing file, like any other bad status.
+        retry = Retry(total=self._http_retries, backoff_factor=0.5,
+                      status_forcelist=[500, 502, 503, 504],
+                      raise_on_status=False)
+        self._session = requests.Session()
+        """Session: HTTP session holding a pool of reusable connections."""
+        self._session.mount('http://', HTTPAdapter(max_retries=retry))
+
+        self._workflow_cache = LRUCache(_workflow_cache_size)
+        """LRUCache: Recently fetched workflows, with their validators."""
+
         basedir = urllib.parse.urlparse(self._basedir)
         if basedir.scheme != 'file':
             raise ValueError('Invalid scheme in store-location-service: ' + basedir.scheme)
@@ -60,31 +96,46 @@ class LocalFiles:
 
         This function will read the job from the database, add a
         .workflow_content attribute with the contents of the
-        referenced file, and return an array of tuples containing
-        the input data.
+        referenced file and a .workflow_json attribute with the
+        parsed workflow serialised as JSON, and return an array of
+        tuples containing the input data.
 
         This function will accept local file:// URLs as well as
         remote http:// URLs.
 
+        Local input files are checked for existence here, but their
+        contents are not read. Instead, each comes with an iterator
+        that reads the file in chunks as it is consumed, so that
+        staging does not need to keep whole files in memory. Remote
+        files are not requested until their iterator is first read,
+        which raises FileNotFoundError if they cannot be fetched.
+        For local files, the
+        SHA-256 digest of the contents is calculated, so that files
+        already on the compute resource need not be transferred again.
+
         Args:
             job_id (str): The id of the job whose input to resolve.
 
         Returns:
-            [Tuple[str, str, bytes]]: One tuple per input file, with
-            fields name, location and contents in that order.
+            [Tuple[str, str, Iterable[bytes], str]]: One tuple per
+            input file, with fields name, location, chunks and digest
+            in that order. The digest is a hexadecimal string, or None
+            if it is not known in advance.
         """
         self._logger.debug("Resolving input for job " + job_id)
         with self._job_store:
             job = self._job_store.get_job(job_id)
 
-            job.workflow_content = self._get_content_from_url(job.workflow)
+            job.workflow_content, job.workflow_json = \
+                    self._get_workflow_from_url(job.workflow)
 
             inputs = json.loads(job.local_input)
             input_files = []
             for name, location in get_files_from_binding(inputs):
                 self._logger.debug("Resolving file " + name + " from " + location)
-                content = self._get_content_from_url(location)
-                input_files.append((name, location, content))
+                chunks = self._stream_from_url(location)
+                digest = self._get_digest_from_url(location)
+                input_files.append((name, location, chunks, digest))
 
             return input_files
 
@@ -116,6 +167,9 @@ class LocalFiles:
 
         Args:
             job_id (str): The id of the job whose output to publish.
+            output_files (List[str, str, Iterable[bytes]]): A list of
+                (name, path, chunks) tuples, as returned by
+                destage_job_output().
         """
         self._logger.debug("Publishing output for job " + job_id)
         with self._job_store:
@@ -123,37 +177,214 @@ class LocalFiles:
             if output_files is not None and output_files != []:
                 output = json.loads(job.remote_output)
                 self.create_output_dir(job_id)
-                for output_name, file_name, content in output_files:
-                    output_loc = self._write_to_output_file(job_id, file_name, content)
+                for output_name, file_name, chunks in output_files:
+                    output_loc = self._write_to_output_file(job_id, file_name, chunks)
                     output[output_name]['location'] = output_loc
                     output[output_name]['path'] = self._to_abs_path('output/' + job_id + '/' + file_name)
 
                 job.local_output = json.dumps(output)
 
-    def _get_content_from_url(self, url):
-        """Return the content referenced by a URL.
+    def _get_workflow_from_url(self, url):
+        """Return the workflow referenced by a URL.
 
         This function will accept local file:// URLs as well as
         remote http:// URLs.
 
+        Args:
+            url (str): The URL to get the workflow from
+
+        Returns:
+            Tuple[bytes, str]: The contents of the file, and the
+            parsed workflow serialised as JSON
+        """
+        parsed_url = urllib.parse.urlparse(url)
+
+        if parsed_url.scheme == 'file':
+            return self._get_workflow_from_file(os.path.join('', parsed_url.path))
+        elif parsed_url.scheme == 'http':
+            return self._get_workflow_from_http(url)
+        else:
+            raise ValueError('Invalid scheme in input URL: ' + url)
+
+    def _stream_from_url(self, url):
+        """Return the content referenced by a URL in chunks.
+
+        This function will accept local file:// URLs as well as
+        remote http:// URLs. The content is read lazily. For file://
+        URLs, the existence of the file is checked right away, while
+        http:// URLs are not requested until the first chunk is asked
+        for, and raise FileNotFoundError then if the resource cannot
+        be fetched.
+
         Args:
             url (str): The URL to get the content of
 
         Returns:
-            bytes: The contents of the file
+            Iterable[bytes]: The contents of the file, in chunks
+
+        Raises:
+            FileNotFoundError: If the local file does not exist.
         """
         parsed_url = urllib.parse.urlparse(url)
 
         if parsed_url.scheme == 'file':
-            return self._read_from_file(os.path.join('', parsed_url.path))
+            abs_path = os.path.join('', parsed_url.path)
+            if not os.path.isfile(abs_path):
+                raise FileNotFoundError(abs_path)
+            return self._stream_from_file(abs_path)
         elif parsed_url.scheme == 'http':
-            response = requests.get(url)
-            if response.status_code != 200:
-                raise FileNotFoundError
-            return response.content
+            # The download is started when the chunks are first asked
+            # for, so that no connection is kept open for inputs that
+            # end up not being staged.
+            return self._stream_from_http(url)
         else:
             raise ValueError('Invalid scheme in input URL: ' + url)
 
+    def _get_workflow_from_file(self, abs_path):
+        """Return the workflow in a local file.
+
+        Workflows are cached in memory together with their parsed
+        form, and read and parsed again only if the file's
+        modification time or size has changed.
+
+        Args:
+            abs_path (str): An absolute local path
+
+        Returns:
+            Tuple[bytes, str]: The contents of the file, and the
+            parsed workflow serialised as JSON
+        """
+        stat = os.stat(abs_path)
+        key = (abs_path, stat.st_mtime_ns, stat.st_size)
+        workflow = self._workflow_cache.get(key)
+        if workflow is None:
+            content = self._read_from_file(abs_path)
+            workflow = content, json.dumps(parse_workflow(content))
+            self._workflow_cache.put(key, workflow)
+        return workflow
+
+    def _get_workflow_from_http(self, url):
+        """Return the workflow in an HTTP resource.
+
+        If the server sent an ETag or Last-Modified header the last
+        time we downloaded this URL, a conditional request is made,
+        and if the resource has not changed, the content and its
+        parsed form are returned from memory.
+
+        Args:
+            url (str): The URL to get the workflow from
+
+        Returns:
+            Tuple[bytes, str]: The contents of the resource, and the
+            parsed workflow serialised as JSON
+        """
+        cached = self._workflow_cache.get(url)
+
+        headers = {}
+        if cached is not None:
+            etag, last_modified, _ = cached
+            if etag is not None:
+                headers['If-None-Match'] = etag
+            if last_modified is not None:
+                headers['If-Modified-Since'] = last_modified
+
+        response = self._session.get(url, headers=headers, timeout=self._http_timeout)
+        if response.status_code == 304 and cached is not None:
+            return cached[2]
+        if response.status_code != 200:
+            raise FileNotFoundError
+
+        workflow = response.content, json.dumps(parse_workflow(response.content))
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag is not None or last_modified is not None:
+            self._workflow_cache.put(url, (etag, last_modified, workflow))
+        return workflow
+
+    def _stream_from_http(self, url):
+        """Download an HTTP resource in chunks.
+
+        The request is sent when the first chunk is asked for, and its
+        status is checked before anything is yielded. If the connection
+        breaks during the download, the rest of the resource is
+        requested with a Range header, up to the configured number of
+        retries.
+
+        Args:
+            url (str): The URL to download
+
+        Yields:
+            bytes: Consecutive chunks of the resource.
+
+        Raises:
+            FileNotFoundError: If the resource could not be fetched.
+        """
+        response = self._session.get(url, stream=True, timeout=self._http_timeout)
+        received = 0
+        resumes = 0
+        try:
+            if response.status_code != 200:
+                raise FileNotFoundError(url)
+            while True:
+                try:
+                    for chunk in response.iter_content(chunk_size=_chunk_size):
+                        received += len(chunk)
+                        yield chunk
+                    return
+                except (requests.exceptions.ChunkedEncodingError,
+                        requests.exceptions.ConnectionError):
+                    if resumes >= self._http_retries:
+                        raise
+                    resumes += 1
+                    self._logger.warning('Download of ' + url + ' interrupted, resuming at byte ' + str(received))
+                    response.close()
+                    response = self._session.get(
+                            url, headers={'Range': 'bytes=' + str(received) + '-'},
+                            stream=True, timeout=self._http_timeout)
+                    if response.status_code != 206:
+                        raise IOError('Could not resume download of ' + url)
+        finally:
+            response.close()
+
+    def _get_digest_from_url(self, url):
+        """Return the SHA-256 digest of the content referenced by a URL.
+
+        Only local file:// URLs are hashed, since for remote ones we
+        would have to download the whole file to find out.
+
+        Args:
+            url (str): The URL to get the digest of
+
+        Returns:
+            str: The digest as a hexadecimal string, or None.
+        """
+        parsed_url = urllib.parse.urlparse(url)
+        if parsed_url.scheme != 'file':
+            return None
+
+        sha256 = hashlib.sha256()
+        for chunk in self._stream_from_file(os.path.join('', parsed_url.path)):
+            sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def _stream_from_file(self, abs_path):
+        """Read data from a local file in chunks.
+
+        This is a generator, the file is opened when iteration starts,
+        and closed when it ends or the generator is closed.
+
+        Args:
+            abs_path (str): An absolute local path
+
+        Yields:
+            bytes: Consecutive chunks of the file.
+        """
+        with open(abs_path, 'rb') as f:
+            chunk = f.read(_chunk_size)
+            while chunk:
+                yield chunk
+                chunk = f.read(_chunk_size)
+
     def _read_from_file(self, abs_path):
         """Read data from a local file.
 
@@ -167,19 +398,23 @@ class LocalFiles:
             data = f.read()
         return data
 
-    def _write_to_output_file(self, job_id, rel_path, data):
+    def _write_to_output_file(self, job_id, rel_path, chunks):
         """Write the data to a local file.
 
+        The data is written chunk by chunk as it comes in, so only
+        one chunk needs to be in memory at any time.
+
         Args:
             job_id (str): The id of the job to write data for
             rel_path (str): A path relative to the job's output directory
-            data (bytes): The data to write
+            chunks (Iterable[bytes]): The data to write
 
         Returns:
             str: An external URL that points to the file
         """
         with open(self._to_abs_path('output/' + job_id + '/' + rel_path), 'wb') as f:
-            f.write(data)
+            for chunk in chunks:
+                f.write(chunk)
 
         return self._to_external_url('output/' + job_id + '/' + rel_path)
 
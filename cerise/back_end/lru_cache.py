@@ -0,0 +1,55 @@
+from collections import OrderedDict
+import threading
+
+class LRUCache:
+    """A thread-safe key-value cache of limited size.
+
+    When the cache is full, adding an item evicts the least recently
+    used one.
+    """
+    def __init__(self, max_size):
+        """Create an LRUCache.
+
+        Args:
+            max_size (int): The maximum number of items to keep.
+        """
+        self._max_size = max_size
+        """int: The maximum number of items to keep."""
+        self._items = OrderedDict()
+        """OrderedDict: The cached items, least recently used first."""
+        self._lock = threading.Lock()
+        """Lock: Protects _items."""
+
+    def get(self, key, default=None):
+        """Look up an item, and mark it as recently used.
+
+        Args:
+            key (Hashable): The key to look up.
+            default (Any): The value to return if the key is not found.
+
+        Returns:
+            Any: The cached value, or default.
+        """
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        """Add or replace an item, evicting the least recently used
+        one if the cache is full.
+
+        Args:
+            key (Hashable): The key to store the value under.
+            value (Any): The value to store.
+        """
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self._max_size:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
@@ -77,8 +77,8 @@ class MockStore:
             return WcJob.output_files
         raise NotImplementedError
 
-    def list_jobs(self):
-        return self._jobs
+    def list_jobs(self, job_ids=None):
+        return [job for job in self._jobs if job_ids is None or job.id in job_ids]
 
     def get_job(self, job_id):
         return [job for job in self._jobs if job.id == job_id][0]
@@ -86,6 +86,10 @@ class MockStore:
     def delete_job(self, job_id):
         pass
 
+    def apply_event(self, event, job_ids=None):
+        return len([job for job in self._jobs
+                    if (job_ids is None or job.id in job_ids) and job.apply_event(event)])
+
     def _create_pass_job(self, job_id, stage):
         pass_wf_path = os.path.join(self._local_base_path, 'input', 'pass_workflow.cwl')
         job = InMemoryJob(job_id, job_id, 'file://' + pass_wf_path, "{}")
@@ -98,6 +102,7 @@ class MockStore:
 
         if stage == "resolved":
             job.workflow_content = PassJob.workflow
+            job.workflow_json = yaml_to_json(PassJob.workflow).decode('utf-8')
             job.state = JobState.STAGING_IN
             return job
 
@@ -160,11 +165,13 @@ class MockStore:
 
         if stage == 'resolved':
             job.workflow_content = WcJob.workflow
+            job.workflow_json = yaml_to_json(WcJob.workflow).decode('utf-8')
             job.state = JobState.STAGING_IN
             return job
 
         if stage == 'staged':
             job.workflow_content = WcJob.workflow
+            job.workflow_json = yaml_to_json(WcJob.workflow).decode('utf-8')
             wc_jobdir = os.path.join(self._remote_base_path, 'jobs', job_id)
             wc_workdir = os.path.join(wc_jobdir, 'work')
             job.remote_workdir_path = wc_workdir
@@ -265,6 +272,7 @@ class MockStore:
 
         if stage == "resolved":
             job.workflow_content = BrokenJob.workflow
+            job.workflow_json = yaml_to_json(BrokenJob.workflow).decode('utf-8')
             job.state = JobState.STAGING_IN
             return job
 
@@ -14,7 +14,7 @@ def test_is_workflow():
 
         steps: []
         """
-    assert cwl.is_workflow(wf)
+    assert cwl.is_workflow(cwl.parse_workflow(wf))
 
 
 def test_is_not_workflow():
@@ -30,7 +30,7 @@ def test_is_not_workflow():
                 type: File
                 outputBinding: { glob: output.txt }
         """
-    assert not cwl.is_workflow(wf)
+    assert not cwl.is_workflow(cwl.parse_workflow(wf))
 
 def test_get_files_from_binding():
     binding = {
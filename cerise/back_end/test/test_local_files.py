@@ -4,8 +4,11 @@ from .mock_store import MockStore
 from cerise.test.fixture_jobs import PassJob
 from cerise.test.fixture_jobs import WcJob
 
+import hashlib
+import json
 import os
 import pytest
+import yaml
 
 @pytest.fixture
 def fixture(request, tmpdir):
@@ -35,13 +38,42 @@ def test_resolve_no_input(fixture):
     fixture['store'].add_test_job('test_resolve_no_input', 'pass', 'submitted')
     fixture['local-files'].resolve_input('test_resolve_no_input')
     assert fixture['store'].get_job('test_resolve_no_input').workflow_content == PassJob.workflow
+    workflow_json = fixture['store'].get_job('test_resolve_no_input').workflow_json
+    assert json.loads(workflow_json) == yaml.safe_load(PassJob.workflow)
+
+def test_resolve_changed_workflow(fixture):
+    fixture['store'].add_test_job('test_resolve_changed_workflow', 'pass', 'submitted')
+    fixture['local-files'].resolve_input('test_resolve_changed_workflow')
+
+    workflow_path = os.path.join(fixture['store']._local_base_path, 'input', 'pass_workflow.cwl')
+    with open(workflow_path, 'ab') as f:
+        f.write(b'\n# changed\n')
+
+    fixture['local-files'].resolve_input('test_resolve_changed_workflow')
+    workflow_content = fixture['store'].get_job('test_resolve_changed_workflow').workflow_content
+    assert workflow_content == PassJob.workflow + b'\n# changed\n'
+
+def test_resolve_cached_workflow(fixture, monkeypatch):
+    parsed = []
+    def counting_parse_workflow(workflow_content):
+        parsed.append(workflow_content)
+        return yaml.safe_load(workflow_content)
+    monkeypatch.setattr('cerise.back_end.local_files.parse_workflow', counting_parse_workflow)
+
+    fixture['store'].add_test_job('test_resolve_cached_workflow', 'pass', 'submitted')
+    fixture['local-files'].resolve_input('test_resolve_cached_workflow')
+    fixture['local-files'].resolve_input('test_resolve_cached_workflow')
+    assert len(parsed) == 1
+    workflow_json = fixture['store'].get_job('test_resolve_cached_workflow').workflow_json
+    assert json.loads(workflow_json) == yaml.safe_load(PassJob.workflow)
 
 def test_resolve_input(fixture):
     fixture['store'].add_test_job('test_resolve_input', 'wc', 'submitted')
     input_files = fixture['local-files'].resolve_input('test_resolve_input')
     assert fixture['store'].get_job('test_resolve_input').workflow_content == WcJob.workflow
     assert input_files[0][0] == WcJob.local_input_files[0][0]
-    assert input_files[0][2] == WcJob.local_input_files[0][2]
+    assert b''.join(input_files[0][2]) == WcJob.local_input_files[0][2]
+    assert input_files[0][3] == hashlib.sha256(WcJob.local_input_files[0][2]).hexdigest()
 
 def test_resolve_missing_input(fixture):
     fixture['store'].add_test_job('test_missing_input', 'missing_input', 'submitted')
@@ -68,7 +100,8 @@ def test_publish_no_output(fixture):
 
 def test_publish_output(fixture):
     fixture['store'].add_test_job('test_publish_output', 'wc', 'destaged')
-    output_files = fixture['store'].get_output_files('wc')
+    output_files = [(name, path, [content]) for name, path, content
+                    in fixture['store'].get_output_files('wc')]
 
     fixture['local-files'].publish_job_output('test_publish_output', output_files)
 
@@ -0,0 +1,22 @@
+from cerise.back_end.lru_cache import LRUCache
+
+def test_get_put():
+    cache = LRUCache(2)
+    assert cache.get('a') is None
+    assert cache.get('a', 1) == 1
+    cache.put('a', 'A')
+    assert cache.get('a') == 'A'
+    cache.put('a', 'AA')
+    assert cache.get('a') == 'AA'
+    assert len(cache) == 1
+
+def test_eviction():
+    cache = LRUCache(2)
+    cache.put('a', 'A')
+    cache.put('b', 'B')
+    assert cache.get('a') == 'A'
+    cache.put('c', 'C')
+    assert len(cache) == 2
+    assert cache.get('a') == 'A'
+    assert cache.get('b') is None
+    assert cache.get('c') == 'C'
@@ -111,6 +111,30 @@ def test_update(fixture):
     updated_job = fixture['store'].get_job('test_update')
     assert updated_job.state == JobState.FINISHED
 
+def test_update_jobs(fixture):
+    store = fixture['store']
+    store.add_test_job('test_update_jobs_waiting', 'slow', 'staged')
+    store.add_test_job('test_update_jobs_waiting_cr', 'slow', 'staged')
+    store.add_test_job('test_update_jobs_done', 'pass', 'staged')
+    store.add_test_job('test_update_jobs_running_cr', 'pass', 'staged')
+    for job_id in ['test_update_jobs_waiting', 'test_update_jobs_waiting_cr',
+                   'test_update_jobs_done', 'test_update_jobs_running_cr']:
+        fixture['xenon-job-runner'].start_job(job_id)
+    store.get_job('test_update_jobs_waiting').state = JobState.WAITING
+    store.get_job('test_update_jobs_waiting_cr').state = JobState.WAITING_CR
+    store.get_job('test_update_jobs_done').state = JobState.WAITING
+    store.get_job('test_update_jobs_running_cr').state = JobState.RUNNING_CR
+
+    time.sleep(2)
+
+    fixture['xenon-job-runner'].update_jobs([
+        'test_update_jobs_waiting', 'test_update_jobs_waiting_cr',
+        'test_update_jobs_done', 'test_update_jobs_running_cr'])
+    assert store.get_job('test_update_jobs_waiting').state == JobState.RUNNING
+    assert store.get_job('test_update_jobs_waiting_cr').state == JobState.RUNNING_CR
+    assert store.get_job('test_update_jobs_done').state == JobState.FINISHED
+    assert store.get_job('test_update_jobs_running_cr').state == JobState.CANCELLED
+
 def test_cancel(fixture):
     fixture['store'].add_test_job('test_cancel', 'slow', 'staged')
     fixture['xenon-job-runner'].start_job('test_cancel')
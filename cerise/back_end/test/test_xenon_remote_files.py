@@ -3,6 +3,8 @@ from cerise.test.xenon import xenon_init
 from .mock_store import MockStore
 from cerise.test.fixture_jobs import WcJob
 
+import hashlib
+import json
 import os
 import pytest
 import xenon
@@ -50,13 +52,37 @@ def test_stage_api(fixture):
 def test_stage_job(fixture):
     fixture['store'].add_test_job('test_stage_job', 'wc', 'resolved')
     input_files = fixture['store'].get_input_files('wc')
-    fixture['xenon-remote-files'].stage_job('test_stage_job', input_files)
+    input_chunks = [(name, location, [content], None) for name, location, content in input_files]
+    fixture['xenon-remote-files'].stage_job('test_stage_job', input_chunks)
 
-    remote_file = os.path.join(fixture['remote-dir'], 'jobs',
-            'test_stage_job', 'work', '01_input_hello_world.txt')
+    input_json = os.path.join(fixture['remote-dir'], 'jobs', 'test_stage_job', 'input.json')
+    with open(input_json, 'r') as f:
+        inputs = json.load(f)
+    assert inputs['file']['basename'] == '01_input_hello_world.txt'
+
+    digest = hashlib.sha256(input_files[0][2]).hexdigest()
+    remote_file = os.path.join(fixture['remote-dir'], 'cache', digest)
+    assert inputs['file']['location'] == remote_file
     with open(remote_file, 'rb') as f:
         contents = f.read()
         assert contents == input_files[0][2]
+    assert os.path.exists(os.path.join(fixture['remote-dir'], 'cache',
+            digest + '.refs', 'test_stage_job'))
+
+def test_stage_job_cached(fixture):
+    input_files = fixture['store'].get_input_files('wc')
+    digest = hashlib.sha256(input_files[0][2]).hexdigest()
+    for job_id in ['test_stage_job_cached_1', 'test_stage_job_cached_2']:
+        fixture['store'].add_test_job(job_id, 'wc', 'resolved')
+        input_chunks = [(name, location, [content], digest) for name, location, content in input_files]
+        fixture['xenon-remote-files'].stage_job(job_id, input_chunks)
+
+    cache_file = os.path.join(fixture['remote-dir'], 'cache', digest)
+    fixture['xenon-remote-files'].delete_job('test_stage_job_cached_1')
+    assert os.path.exists(cache_file)
+    fixture['xenon-remote-files'].delete_job('test_stage_job_cached_2')
+    assert not os.path.exists(cache_file)
+    assert not os.path.exists(cache_file + '.refs')
 
 def test_destage_job_no_output(fixture):
     fixture['store'].add_test_job('test_destage_job_no_output', 'pass', 'run_and_updated')
@@ -66,6 +92,7 @@ def test_destage_job_no_output(fixture):
 def test_destage_job_output(fixture):
     fixture['store'].add_test_job('test_destage_job_output', 'wc', 'run_and_updated')
     output_files = fixture['xenon-remote-files'].destage_job_output('test_destage_job_output')
+    output_files = [(name, path, b''.join(chunks)) for name, path, chunks in output_files]
     assert output_files == WcJob.output_files
 
 def test_delete_job(fixture):
@@ -81,3 +108,19 @@ def test_update_job(fixture):
     wc_remote_workdir = os.path.join(fixture['remote-dir'], 'jobs', 'test_update_job', 'work')
     assert fixture['store'].get_job('test_update_job').remote_output == WcJob.remote_output('file://' + wc_remote_workdir)
     # check that we have the log?
+
+def test_update_job_log(fixture):
+    fixture['store'].add_test_job('test_update_job_log', 'wc', 'run')
+    stderr_path = os.path.join(fixture['remote-dir'], 'jobs', 'test_update_job_log', 'stderr.txt')
+    with open(stderr_path, 'wb') as f:
+        f.write(b'Step 1 \xc3')
+
+    fixture['xenon-remote-files'].update_job('test_update_job_log')
+    assert fixture['store'].get_job('test_update_job_log').log == 'Step 1 '
+
+    with open(stderr_path, 'ab') as f:
+        f.write(b'\xa9\nStep 2\n')
+    fixture['xenon-remote-files'].update_job('test_update_job_log')
+    assert fixture['store'].get_job('test_update_job_log').log == 'Step 1 \u00e9\nStep 2\n'
+    # the job is finished, so it is not tracked any longer
+    assert 'test_update_job_log' not in fixture['xenon-remote-files']._log_tails
@@ -3,8 +3,10 @@ import logging
 import os
 import xenon
 
+from cerise.job_store.job_event import JobEvent
 from cerise.job_store.job_state import JobState
 
+from time import perf_counter
 from time import sleep
 
 class XenonJobRunner:
@@ -30,6 +32,8 @@ class XenonJobRunner:
         """str: The remote path to the cwl runner executable."""
         self._sched = None
         """The Xenon scheduler to start jobs through."""
+        self._scheme = None
+        """str: The Xenon scheme of the scheduler."""
         self._queue_name = xenon_config['jobs'].get('queue-name')
         """The name of the remote queue to submit jobs to."""
         self._mpi_slots_per_node = xenon_config['jobs'].get('slots-per-node', 1)
@@ -102,6 +106,7 @@ class XenonJobRunner:
 
     def _make_scheduler(self, xenon_config):
         scheme = self._get_scheme(xenon_config)
+        self._scheme = scheme
         location = self._get_location(xenon_config)
 
         username, credential = self._get_credential(xenon_config)
@@ -154,23 +159,40 @@ class XenonJobRunner:
         Args:
             job_id (str): ID of the job to get the status of.
         """
-        self._logger.debug("Updating job " + job_id + " from remote job")
-        with self._job_store:
-            job = self._job_store.get_job(job_id)
-            active_jobs = self._x.jobs().getJobs(self._sched, [])
-            xenon_job = [x_job for x_job in active_jobs if x_job.getIdentifier() == job.remote_job_id]
-            if len(xenon_job) == 1:
-                xenon_status = self._x.jobs().getJobStatus(xenon_job[0])
-                if xenon_status.isRunning():
-                    job.try_transition(JobState.WAITING, JobState.RUNNING)
-                    job.try_transition(JobState.WAITING_CR, JobState.RUNNING_CR)
-                    return
+        self.update_jobs([job_id])
+
+    def update_jobs(self, job_ids):
+        """Get status of a number of jobs from Xenon and update store.
 
+        This queries the remote scheduler once for all the jobs,
+        and applies the resulting state changes to all of them using
+        two updates, within a single unit of work.
+
+        Args:
+            job_ids (List[str]): IDs of the jobs to get the status of.
+        """
+        if not job_ids:
+            return
+
+        self._logger.debug("Updating " + str(len(job_ids)) + " jobs from remote jobs")
+        xenon_jobs = self._get_remote_jobs()
+        with self._job_store:
+            jobs = self._job_store.list_jobs(job_ids=job_ids)
+
+            found_jobs = [job for job in jobs if job.remote_job_id in xenon_jobs]
+            running_ids = set()
+            if found_jobs:
+                xenon_statuses = self._x.jobs().getJobStatuses(
+                        [xenon_jobs[job.remote_job_id] for job in found_jobs])
+                for job, xenon_status in zip(found_jobs, xenon_statuses):
+                    if xenon_status.isRunning():
+                        running_ids.add(job.id)
+
+            self._job_store.apply_event(JobEvent.REMOTE_RUNNING,
+                    job_ids=[job.id for job in jobs if job.id in running_ids])
             # Not running, so it's finished unless we cancelled it
-            job.try_transition(JobState.WAITING, JobState.FINISHED)
-            job.try_transition(JobState.RUNNING, JobState.FINISHED)
-            job.try_transition(JobState.WAITING_CR, JobState.CANCELLED)
-            job.try_transition(JobState.RUNNING_CR, JobState.CANCELLED)
+            self._job_store.apply_event(JobEvent.REMOTE_DONE,
+                    job_ids=[job.id for job in jobs if job.id not in running_ids])
 
     def start_job(self, job_id):
         """Get a job from the job store and start it on the compute resource.
@@ -202,8 +224,28 @@ class XenonJobRunner:
             job.remote_job_id = xenon_job.getIdentifier()
             self._logger.debug('Job submitted')
 
+        if self._scheme == 'local':
+            self._wait_until_started(xenon_job)
+
+    def _wait_until_started(self, xenon_job, timeout=1.0):
+        """Wait until a submitted job has actually started.
+
+        This is a work-around for a Xenon local running bug, where
+        a job that is queried immediately after submission is not
+        found. Other adaptors do not need this.
+
+        Args:
+            xenon_job (Job): The Xenon job to wait for.
+            timeout (float): The maximum time to wait, in seconds.
+        """
+        deadline = perf_counter() + timeout
         try:
-            sleep(1)    # work-around for Xenon local running bug
+            status = self._x.jobs().getJobStatus(xenon_job)
+            while not (status.isRunning() or status.isDone()):
+                if perf_counter() > deadline:
+                    break
+                sleep(0.05)
+                status = self._x.jobs().getJobStatus(xenon_job)
         except KeyboardInterrupt:
             pass        # exit gracefully
 
@@ -231,14 +273,22 @@ class XenonJobRunner:
         with self._job_store:
             job = self._job_store.get_job(job_id)
             if JobState.is_remote(job.state):
-                active_jobs = self._x.jobs().getJobs(self._sched, [])
-                xenon_job = [x_job for x_job in active_jobs if x_job.getIdentifier() == job.remote_job_id]
-                if len(xenon_job) == 1:
-                    status = self._x.jobs().getJobStatus(xenon_job[0])
+                xenon_job = self._get_remote_jobs().get(job.remote_job_id)
+                if xenon_job is not None:
+                    status = self._x.jobs().getJobStatus(xenon_job)
                     if status.isRunning():
                         try:
-                            new_state = self._x.jobs().cancelJob(xenon_job[0])
+                            new_state = self._x.jobs().cancelJob(xenon_job)
                         except jpype.JException(XenonException):
                             return False
                         return bool(new_state.isRunning())
         return False
+
+    def _get_remote_jobs(self):
+        """Get the jobs currently known to the remote scheduler.
+
+        Returns:
+            Dict[str, Job]: Xenon Job objects, indexed by identifier.
+        """
+        active_jobs = self._x.jobs().getJobs(self._sched, [])
+        return {x_job.getIdentifier(): x_job for x_job in active_jobs}
@@ -1,12 +1,18 @@
+import array
+import codecs
+import hashlib
 import jpype
 import json
 import logging
 import os
 import re
+import threading
 import xenon
-import yaml
 
+from cerise.job_store.job_state import JobState
+from cerise.parsing import load_yaml
 from .cwl import get_files_from_binding
+from .lru_cache import LRUCache
 
 class XenonRemoteFiles:
     """Manages a remote directory structure.
@@ -22,6 +28,15 @@ class XenonRemoteFiles:
       working directory for the job.
     - jobs/<job_id>/stdout.txt is the standard output of the CWL runner
     - jobs/<job_id>/stderr.txt is the standard error of the CWL runner
+    - jobs/<job_id>/cache_refs.txt lists the digests of the cached
+      input files the job uses, one per line
+
+    Input files are not stored per job, but in a cache/ directory next
+    to jobs/, under the hexadecimal SHA-256 digest of their contents,
+    so that an input used by many jobs is transferred and stored only
+    once. For each job that uses a cached file, there is an empty file
+    cache/<digest>.refs/<job_id>, and the cached file is removed when
+    the last job using it is deleted.
     """
 
     def __init__(self, job_store, x, xenon_config):
@@ -55,6 +70,15 @@ class XenonRemoteFiles:
         """str: The remote path to the directory where the API steps are."""
         self._local_fs = None
         """FileSystem: Xenon object for the local file system."""
+        self._buffer_size = xenon_config['files'].get('buffer-size', 1024 * 1024)
+        """int: The size of the chunks to transfer files in, in bytes."""
+        self._cache_lock = threading.Lock()
+        """Lock: Protects the reference counts of cached input files."""
+        self._translated_workflows = LRUCache(100)
+        """LRUCache: Translated workflows, by digest of the original."""
+        self._log_tails = {}
+        """Dict[str, _LogTail]: Which versions of their output files
+        have been read, for jobs on the remote resource."""
 
         self._create_fss(xenon_config)
 
@@ -77,6 +101,12 @@ class XenonRemoteFiles:
         except jpype.JException(PathAlreadyExistsException):
             pass
 
+        # Create a subdirectory for cached input files
+        try:
+            self._x.files().createDirectories(self._x_cache_path(''))
+        except jpype.JException(PathAlreadyExistsException):
+            pass
+
     def stage_api(self, local_api_dir):
         """Stage the API to the compute resource. Copies subdirectory
         steps/ of the given local api dir to the compute resource.
@@ -110,8 +140,15 @@ class XenonRemoteFiles:
         """Stage a job. Copies any necessary files to
         the remote resource.
 
+        Input files are put into the cache, and the input description
+        refers to them there, with a basename that tells the runner
+        what to call them when copying them into the work directory.
+
         Args:
             job_id (str): The id of the job to stage
+            input_files (List[str, str, Iterable[bytes], str]): A list
+                of (name, location, chunks, digest) tuples, as returned
+                by LocalFiles.resolve_input().
         """
         self._logger.debug('Staging job ' + job_id)
         with self._job_store:
@@ -126,18 +163,19 @@ class XenonRemoteFiles:
             self._write_remote_file(job_id, 'name.txt', job.name.encode('utf-8'))
 
             # stage workflow
-            remote_workflow_content = self._translate_steps(job.workflow_content)
+            remote_workflow_content = self._translate_steps(job.workflow_json)
             self._write_remote_file(job_id, 'workflow.cwl', remote_workflow_content)
             job.remote_workflow_path = self._abs_path(job_id, 'workflow.cwl')
 
             # stage input files
             inputs = json.loads(job.local_input)
             count = 1
-            for name, location, content in input_files:
+            for name, location, chunks, digest in input_files:
                 staged_name = _create_input_filename(str(count).zfill(2), location)
                 count += 1
-                self._write_remote_file(job_id, 'work/' + staged_name, content)
-                inputs[name]['location'] = self._abs_path(job_id, 'work/' + staged_name)
+                digest = self._stage_cached_input(job_id, staged_name, chunks, digest)
+                inputs[name]['location'] = self._basedir + '/cache/' + digest
+                inputs[name]['basename'] = staged_name
 
             # stage input description
             inputs_json = json.dumps(inputs).encode('utf-8')
@@ -151,13 +189,20 @@ class XenonRemoteFiles:
     def destage_job_output(self, job_id):
         """Download results of the given job from the compute resource.
 
+        The contents of the files are not read here, instead an
+        iterator is returned for each file that reads it in chunks
+        as it is consumed, so that large outputs do not have to fit
+        in memory.
+
         Args:
             job_id (str): The id of the job to download results of.
 
         Returns:
-            List[str, str, bytes]: A list of (name, path, content) tuples.
+            List[str, str, Iterable[bytes]]: A list of (name, path,
+            chunks) tuples.
         """
         self._logger.debug('Destaging job ' + job_id)
+        self.forget_job(job_id)
         output_files = []
         with self._job_store:
             job = self._job_store.get_job(job_id)
@@ -171,10 +216,10 @@ class XenonRemoteFiles:
                         raise Exception("Unexpected output location in cwl-runner output: " + path
                                 + ", expected it to start with: " + prefix)
                     rel_path = path[len(prefix):]
-                    content = self._read_remote_file(job_id, 'work/' + rel_path)
-                    output_files.append((output_name, rel_path, content))
+                    chunks = self._stream_remote_file(job_id, 'work/' + rel_path)
+                    output_files.append((output_name, rel_path, chunks))
 
-        # output_name and rel_path are (immutable) str's, while content
+        # output_name and rel_path are (immutable) str's, while chunks
         # does not come from the store, so we're not leaking here
         return output_files
 
@@ -185,51 +230,231 @@ class XenonRemoteFiles:
         Args:
             job_id (str): The id of the job whose work directory to delete.
         """
+        self.forget_job(job_id)
+        cache_refs = self._read_remote_file(job_id, 'cache_refs.txt')
+        for digest in cache_refs.decode().split():
+            self._remove_cache_ref(job_id, digest)
         self._rm_remote_dir(job_id, '')
 
+    def forget_job(self, job_id):
+        """Stop keeping track of a job's output files.
+
+        Call this when a job leaves the remote states other than
+        through update_job(), e.g. because it was cancelled.
+
+        Args:
+            job_id (str): The id of the job.
+        """
+        self._log_tails.pop(job_id, None)
+
     def update_job(self, job_id):
         """Get status from Xenon and update store.
 
+        Files that have not changed size or modification time since
+        the last update are not read again. Of the log, only the part
+        after what is already in the job's log is read, and appended
+        to it. Since the position is taken from the stored log, a
+        part that was read but not committed is simply read again.
+
         Args:
             job_id (str): ID of the job to get the status of.
         """
         self._logger.debug("Updating " + job_id + " from remote files")
+        tail = self._log_tails.get(job_id, _LogTail())
         with self._job_store:
             job = self._job_store.get_job(job_id)
 
             # get output
-            output = self._read_remote_file(job_id, 'stdout.txt')
-            if len(output) > 0:
-                self._logger.debug("Output:")
-                self._logger.debug(output)
-                job.remote_output = output.decode()
+            stdout_stamp = self._get_remote_file_stamp(job_id, 'stdout.txt')
+            if stdout_stamp != tail.stdout_stamp:
+                output = self._read_remote_file(job_id, 'stdout.txt')
+                if len(output) > 0:
+                    self._logger.debug("Output:")
+                    self._logger.debug(output)
+                    job.remote_output = output.decode()
 
             # get log
-            log = self._read_remote_file(job_id, 'stderr.txt')
-            if len(log) > 0:
-                job.log = log.decode()
-                self._logger.debug("Log:")
-                self._logger.debug(job.log)
+            stderr_stamp = self._get_remote_file_stamp(job_id, 'stderr.txt')
+            if stderr_stamp != tail.stderr_stamp:
+                offset = job.log_size
+                if stderr_stamp is None or stderr_stamp[0] < offset:
+                    # file disappeared or was truncated, start over
+                    offset = 0
+                new_log = b''.join(self._stream_remote_file(
+                        job_id, 'stderr.txt', offset))
+                # A partial character at the end is not decoded, and
+                # is read again next time, when the rest is there.
+                log = codecs.getincrementaldecoder('utf-8')().decode(new_log)
+                if len(log) > 0:
+                    if offset == 0:
+                        job.log = log
+                    else:
+                        job.append_log(log)
+                    self._logger.debug("Log:")
+                    self._logger.debug(log)
+
+            is_remote = JobState.is_remote(job.state)
+
+        if is_remote:
+            self._log_tails[job_id] = _LogTail(stdout_stamp, stderr_stamp)
+        else:
+            # no more updates coming, so forget about it
+            self._log_tails.pop(job_id, None)
+
+    def _get_remote_file_stamp(self, job_id, rel_path):
+        """Return the size and modification time of a remote file.
+
+        Args:
+            job_id (str): A job from whose dir the file is
+            rel_path (str): A path relative to the job's directory
+
+        Returns:
+            Union[Tuple[int, int], NoneType]: The size in bytes and
+            the modification time, or None if the file does not exist.
+        """
+        x_remote_path = self._x_abs_path(job_id, rel_path)
+        if not self._x.files().exists(x_remote_path):
+            return None
+        attributes = self._x.files().getAttributes(x_remote_path)
+        return attributes.size(), attributes.lastModifiedTime()
 
-    def _translate_steps(self, workflow_content):
+    def _stage_cached_input(self, job_id, staged_name, chunks, digest):
+        """Make sure an input file is in the cache, and add a reference
+        to it for the given job.
+
+        If the digest is known and the file is in the cache already,
+        it is not transferred. Otherwise, it is written into the work
+        directory, hashed on the way, and then moved into the cache.
+
+        Args:
+            job_id (str): The id of the job to stage for
+            staged_name (str): Name of the file in the work directory
+            chunks (Iterable[bytes]): The contents of the file
+            digest (str): The SHA-256 digest of the file, or None
+
+        Returns:
+            str: The SHA-256 digest of the file.
+        """
+        if digest is not None:
+            with self._cache_lock:
+                self._add_cache_ref(job_id, digest)
+                in_cache = self._x.files().exists(self._x_cache_path(digest))
+            if in_cache:
+                self._logger.debug('Input ' + staged_name + ' found in cache')
+                if hasattr(chunks, 'close'):
+                    chunks.close()
+                return digest
+
+        sha256 = hashlib.sha256()
+        def hashed_chunks():
+            for chunk in chunks:
+                sha256.update(chunk)
+                yield chunk
+
+        self._stream_to_remote_file(job_id, 'work/' + staged_name, hashed_chunks())
+        if digest is not None and sha256.hexdigest() != digest:
+            raise RuntimeError('Input file ' + staged_name + ' changed while staging')
+        digest = sha256.hexdigest()
+
+        x_work_path = self._x_abs_path(job_id, 'work/' + staged_name)
+        x_cache_path = self._x_cache_path(digest)
+        with self._cache_lock:
+            self._add_cache_ref(job_id, digest)
+            if self._x.files().exists(x_cache_path):
+                self._x.files().delete(x_work_path)
+            else:
+                self._x.files().move(x_work_path, x_cache_path)
+        return digest
+
+    def _add_cache_ref(self, job_id, digest):
+        """Register a job as using a cached input file.
+
+        Must be called with _cache_lock held.
+
+        Args:
+            job_id (str): The id of the job using the file
+            digest (str): The SHA-256 digest of the file
+        """
+        from xenon.files import OpenOption
+        PathAlreadyExistsException = xenon.nl.esciencecenter.xenon.files.PathAlreadyExistsException
+
+        x_refs_dir = self._x_cache_path(digest + '.refs')
+        try:
+            self._x.files().createDirectories(x_refs_dir)
+        except jpype.JException(PathAlreadyExistsException):
+            pass
+
+        x_ref = self._x_cache_path(digest + '.refs/' + job_id)
+        if self._x.files().exists(x_ref):
+            return
+        self._x.files().createFile(x_ref)
+
+        cache_refs = self._read_remote_file(job_id, 'cache_refs.txt')
+        cache_refs += (digest + '\n').encode()
+        x_cache_refs = self._x_abs_path(job_id, 'cache_refs.txt')
+        stream = self._x.files().newOutputStream(x_cache_refs,
+                [OpenOption.OPEN_OR_CREATE, OpenOption.TRUNCATE])
+        stream.write(cache_refs)
+        stream.close()
+
+    def _remove_cache_ref(self, job_id, digest):
+        """Unregister a job as using a cached input file, and remove
+        the file from the cache if no other job uses it.
+
+        Args:
+            job_id (str): The id of the job that used the file
+            digest (str): The SHA-256 digest of the file
+        """
+        with self._cache_lock:
+            x_ref = self._x_cache_path(digest + '.refs/' + job_id)
+            if self._x.files().exists(x_ref):
+                self._x.files().delete(x_ref)
+
+            x_refs_dir = self._x_cache_path(digest + '.refs')
+            if not self._x.files().exists(x_refs_dir):
+                return
+            refs = self._x.files().newDirectoryStream(x_refs_dir)
+            try:
+                in_use = refs.iterator().hasNext()
+            finally:
+                refs.close()
+
+            if not in_use:
+                self._logger.debug('Removing ' + digest + ' from input cache')
+                x_cache_path = self._x_cache_path(digest)
+                if self._x.files().exists(x_cache_path):
+                    self._x.files().delete(x_cache_path)
+                self._x.files().delete(x_refs_dir)
+
+    def _translate_steps(self, workflow_json):
         """Parse workflow content, check that it calls steps, and
         insert the location of the steps on the remote resource so that
         the remote runner can find them.
 
+        Results are cached by the digest of the workflow, so that a
+        workflow submitted many times is translated only once.
+
         Args:
-            workflow_content (bytes): The raw workflow data
+            workflow_json (str): The parsed workflow, serialised as JSON
 
         Returns:
             bytes: The modified workflow data, serialised as JSON
 
         """
-        workflow = yaml.safe_load(str(workflow_content, 'utf-8'))
+        digest = hashlib.sha256(workflow_json.encode('utf-8')).hexdigest()
+        translated = self._translated_workflows.get(digest)
+        if translated is not None:
+            return translated
+
+        workflow = json.loads(workflow_json)
         for _, step in workflow['steps'].items():
             if not isinstance(step['run'], str):
                 raise RuntimeError('Invalid step in workflow')
             # check against known steps?
             step['run'] = self._api_steps_dir + '/' + step['run']
-        return bytes(json.dumps(workflow), 'utf-8')
+        translated = bytes(json.dumps(workflow), 'utf-8')
+        self._translated_workflows.put(digest, translated)
+        return translated
 
     def _stage_api_steps(self, local_api_dir, remote_api_dir):
         """Copy the CWL steps forming the API to the remote compute
@@ -251,7 +476,8 @@ class XenonRemoteFiles:
                 self._logger.debug('Scanning file for staging: ' + this_dir + '/' + str(files))
                 for filename in files:
                     if filename.endswith('.cwl'):
-                        cwlfile = yaml.safe_load(open(os.path.join(this_dir, filename), 'r'))
+                        with open(os.path.join(this_dir, filename), 'r') as f:
+                            cwlfile = load_yaml(f)
                         # do CERISE_API_FILES macro substitution
                         if cwlfile.get('class') == 'CommandLineTool':
                             if 'baseCommand' in cwlfile:
@@ -396,12 +622,25 @@ class XenonRemoteFiles:
             rel_path (str): A path relative to the job's directory
             data (bytes): The data to write
         """
+        self._stream_to_remote_file(job_id, rel_path, [data])
+
+    def _stream_to_remote_file(self, job_id, rel_path, chunks):
+        """Write a file on the remote resource, chunk by chunk.
+
+        Args:
+            job_id (str): The id of the job to write data for
+            rel_path (str): A path relative to the job's directory
+            chunks (Iterable[bytes]): The data to write
+        """
         from xenon.files import OpenOption
 
         x_remote_path = self._x_abs_path(job_id, rel_path)
         stream = self._x.files().newOutputStream(x_remote_path, [OpenOption.CREATE, OpenOption.TRUNCATE])
-        stream.write(data)
-        stream.close()
+        try:
+            for chunk in chunks:
+                stream.write(chunk)
+        finally:
+            stream.close()
 
     def _read_remote_file(self, job_id, rel_path):
         """Read data from a remote file.
@@ -409,30 +648,49 @@ class XenonRemoteFiles:
         Args:
             job_id (str): A job from whose work dir a file is read
             rel_path (str): A path relative to the job's directory
+
+        Returns:
+            bytes: The contents of the file, or an empty bytes object
+            if it does not exist.
         """
-        result = bytearray()
+        return b''.join(self._stream_remote_file(job_id, rel_path))
 
-        def sbyte_to_ubyte(buf, size):
-            ret = bytearray(size)
-            for i, val in enumerate(buf[0:size]):
-                if val >= 0:
-                    ret[i] = val
-                else:
-                    ret[i] = val + 256
-            return ret
+    def _stream_remote_file(self, job_id, rel_path, offset=0):
+        """Read data from a remote file in chunks.
 
+        This is a generator, the file is opened when iteration starts,
+        and closed when it ends or the generator is closed. If the file
+        does not exist, no chunks are produced.
+
+        Args:
+            job_id (str): A job from whose work dir a file is read
+            rel_path (str): A path relative to the job's directory
+            offset (int): Position in the file to start reading at
+
+        Yields:
+            bytes: Consecutive chunks of the file, of at most the
+            configured buffer size.
+        """
         x_remote_path = self._x_abs_path(job_id, rel_path)
-        if self._x.files().exists(x_remote_path):
-            stream = self._x.files().newInputStream(x_remote_path)
-            buf = jpype.JArray(jpype.JByte)(1024)
+        if not self._x.files().exists(x_remote_path):
+            return
+
+        stream = self._x.files().newInputStream(x_remote_path)
+        try:
+            while offset > 0:
+                skipped = stream.skip(offset)
+                if skipped <= 0:
+                    return
+                offset -= skipped
+
+            buf = jpype.JArray(jpype.JByte)(self._buffer_size)
             bytes_read = stream.read(buf)
             while bytes_read != -1:
-                result = bytearray().join([result, sbyte_to_ubyte(buf, bytes_read)])
+                yield _java_bytes_to_bytes(buf, bytes_read)
                 bytes_read = stream.read(buf)
+        finally:
             stream.close()
 
-        return result
-
     def _abs_path(self, job_id, rel_path):
         """Return an absolute remote path given a job-relative path.
 
@@ -462,6 +720,22 @@ class XenonRemoteFiles:
         xenon_path = xenon.files.RelativePath(abs_path)
         return self._x.files().newPath(self._fs, xenon_path)
 
+    def _x_cache_path(self, rel_path):
+        """Return a Xenon Path object for a path in the input cache.
+
+        Args:
+            rel_path (str): A path relative to the cache directory
+
+        Returns:
+            Path: A Xenon Path object corresponding to the input
+        """
+        from xenon.files import RelativePath
+
+        abs_path = self._basedir + '/cache'
+        if rel_path != '':
+            abs_path += '/' + rel_path
+        return self._x.files().newPath(self._fs, RelativePath(abs_path))
+
     def _create_fss(self, xenon_config):
         """Create local and remote file systems.
         """
@@ -496,6 +770,41 @@ class XenonRemoteFiles:
             self._fs = self._x.files().newFileSystem(
                     scheme, location, None, None)
 
+class _LogTail:
+    """Keeps track of which versions of a job's output files have
+    been read."""
+    def __init__(self, stdout_stamp=None, stderr_stamp=None):
+        self.stdout_stamp = stdout_stamp
+        """Union[Tuple[int, int], NoneType]: Size and modification
+        time of stdout.txt when last read."""
+        self.stderr_stamp = stderr_stamp
+        """Union[Tuple[int, int], NoneType]: Size and modification
+        time of stderr.txt when last read."""
+
+def _java_bytes_to_bytes(buf, size):
+    """Convert the start of a Java byte array to a Python bytes object.
+
+    This converts the whole range in one go, rather than byte by byte.
+    Java bytes are signed, but since they are copied as raw memory,
+    the result has the same bits and so the right unsigned values.
+
+    Args:
+        buf (JArray(JByte)): The Java array to convert from.
+        size (int): The number of bytes to convert.
+
+    Returns:
+        bytes: The first size bytes of buf.
+    """
+    try:
+        return memoryview(buf)[0:size].tobytes()
+    except TypeError:
+        # Older JPype versions do not support the buffer protocol,
+        # and give us either bytes or a list of ints for a slice.
+        chunk = buf[0:size]
+        if isinstance(chunk, bytes):
+            return chunk
+        return array.array('b', chunk).tobytes()
+
 def _create_input_filename(unique_prefix, orig_path):
     """Return a string containing a remote filename that
     resembles the original path this file was submitted with.
@@ -1,4 +1,4 @@
-import yaml
+from cerise.parsing import load_yaml
 
 config = None
 """
@@ -15,8 +15,8 @@ The API configuration dictionary, as parsed from the YAML
 
 _config_file_path = 'conf/config.yml'
 with open(_config_file_path) as config_file:
-    config = yaml.safe_load(config_file)
+    config = load_yaml(config_file)
 
 _api_config_file_path = 'api/config.yml'
 with open(_api_config_file_path) as api_config_file:
-    api_config = yaml.safe_load(api_config_file)
+    api_config = load_yaml(api_config_file)
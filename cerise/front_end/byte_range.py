@@ -0,0 +1,35 @@
+import re
+
+def parse_byte_range(range_header, size):
+    """Parse an HTTP Range header.
+
+    Only a single byte range is supported, other headers are
+    ignored, as HTTP allows.
+
+    Args:
+        range_header (str): The value of the Range header.
+        size (int): The size of the resource in bytes.
+
+    Returns:
+        Union[Tuple[int, int], NoneType]: The first and
+        one-past-the-last byte, or None if the header is to be
+        ignored.
+
+    Raises:
+        ValueError: If the range is not satisfiable.
+    """
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', range_header.strip())
+    if match is None or match.group(1) == match.group(2) == '':
+        return None
+
+    if match.group(1) == '':
+        # suffix range, the last n bytes
+        start = max(size - int(match.group(2)), 0)
+        end = size
+    else:
+        start = int(match.group(1))
+        end = size if match.group(2) == '' else min(int(match.group(2)) + 1, size)
+
+    if start >= size or start >= end:
+        raise ValueError('Unsatisfiable range')
+    return start, end
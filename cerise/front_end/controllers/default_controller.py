@@ -2,13 +2,18 @@ import connexion
 from front_end.models.job import Job
 from front_end.models.job_description import JobDescription
 import flask
+import hashlib
 import json
 
+from cerise.front_end.byte_range import parse_byte_range
 from cerise.job_store import job_state
 from cerise.job_store.sqlite_job_store import SQLiteJobStore
 from cerise.config import config
 
-_job_store = SQLiteJobStore(config['database']['file'])
+_job_store = SQLiteJobStore.from_config(config['database'])
+
+_log_chunk_size = 64 * 1024
+"""int: Size of the pieces a log is sent to the client in, in bytes."""
 
 def _internal_job_to_rest_job(job):
     if job.local_output == '':
@@ -43,18 +48,11 @@ def cancel_job_by_id(jobId):
     :rtype: Job
     """
     with _job_store:
-        job = _job_store.get_job(jobId)
-        if not job:
+        if _job_store.get_job_version(jobId) is None:
             flask.abort(404, "Job not found")
+        _job_store.cancel_jobs(job_ids=[jobId])
 
-        job.try_transition(job_state.JobState.SUBMITTED, job_state.JobState.CANCELLED)
-        job.try_transition(job_state.JobState.STAGING_IN, job_state.JobState.STAGING_IN_CR)
-        job.try_transition(job_state.JobState.WAITING, job_state.JobState.WAITING_CR)
-        job.try_transition(job_state.JobState.RUNNING, job_state.JobState.RUNNING_CR)
-        job.try_transition(job_state.JobState.FINISHED, job_state.JobState.CANCELLED)
-        job.try_transition(job_state.JobState.STAGING_OUT, job_state.JobState.STAGING_OUT_CR)
-
-    return get_job_by_id(jobId)
+    return _job_response(jobId, 200)
 
 
 def delete_job_by_id(jobId):
@@ -67,56 +65,279 @@ def delete_job_by_id(jobId):
     :rtype: None
     """
     with _job_store:
-        cancel_job_by_id(jobId)
-        job = _job_store.get_job(jobId)
-        job.please_delete = True
+        if _job_store.get_job_version(jobId) is None:
+            flask.abort(404, "Job not found")
+        _job_store.delete_jobs(job_ids=[jobId])
     return None, 204
 
 
-def get_job_by_id(jobId):
+def post_jobs_cancel(body):
+    """
+    Cancel several jobs
+    Cancel all jobs matching the given ids, name and/or state, using a
+    single update.
+    :param body: Selection of the jobs to cancel
+    :type body: dict
+
+    :rtype: dict
+    """
+    with _job_store:
+        count = _job_store.cancel_jobs(**_job_selection(body))
+    return {'count': count}, 200
+
+
+def post_jobs_delete(body):
+    """
+    Delete several jobs
+    Delete all jobs matching the given ids, name and/or state, using a
+    single update. Jobs that are waiting or running are cancelled first.
+    :param body: Selection of the jobs to delete
+    :type body: dict
+
+    :rtype: dict
+    """
+    with _job_store:
+        count = _job_store.delete_jobs(**_job_selection(body))
+    return {'count': count}, 200
+
+
+def _job_selection(body):
+    """
+    Convert a job selection from the REST API to store arguments.
+
+    At least one criterion must be given, so that all jobs are not
+    cancelled or deleted by accident.
+
+    :param body: The selection, with optional ids, name and state
+    :type body: dict
+
+    :rtype: dict
+    :return: Keyword arguments for cancel_jobs() or delete_jobs()
+    """
+    if connexion.request.is_json:
+        body = connexion.request.get_json()
+
+    selection = {
+            'job_ids': body.get('ids'),
+            'name': body.get('name'),
+            'states': _internal_states(body.get('state'))}
+    if all(value is None for value in selection.values()):
+        flask.abort(400, "No jobs selected, give ids, name and/or state")
+    return selection
+
+
+def _internal_states(state):
+    """
+    Return the internal states corresponding to a CWL state.
+
+    :param state: A CWL state string, or None
+    :type state: str
+
+    :rtype: Union[List[JobState], NoneType]
+    """
+    if state is None:
+        return None
+    return [internal_state for internal_state in job_state.JobState
+            if job_state.JobState.to_cwl_state_string(internal_state) == state]
+
+
+def get_job_by_id(jobId, wait=None):
     """
     Get a job
+    If wait is given, and either the request has an If-None-Match
+    header matching the current version of the job, or no
+    If-None-Match header at all, then this waits for up to wait
+    seconds for the job to change before responding.
 
     :param jobId: Job ID
     :type jobId: str
+    :param wait: Maximum time to wait for a change, in seconds
+    :type wait: float
 
     :rtype: Job
     """
     with _job_store:
-        job = _job_store.get_job(jobId)
+        version = _job_store.get_job_version(jobId)
+    if version is None:
+        flask.abort(404, "Job not found")
+
+    etag = _job_etag(jobId, version)
+    if_none_match = flask.request.if_none_match
+    not_modified = if_none_match.contains_weak(etag)
+    if wait is not None and (not_modified or not if_none_match):
+        # The store is not held while waiting, and the wait sleeps
+        # using time.sleep(), which gevent makes cooperative.
+        version = _job_store.wait_for_job_change(jobId, version, wait)
+        if version is None:
+            flask.abort(404, "Job not found")
+        etag = _job_etag(jobId, version)
+        not_modified = if_none_match.contains_weak(etag)
+
+    if not_modified:
+        return _not_modified(etag)
+    return _job_response(jobId, 200)
+
+
+def _job_response(job_id, status):
+    """
+    Make a response containing a job, with an ETag.
+
+    The version is read before the job, so that if the job changes
+    in between, the ETag will be out of date rather than the job,
+    and the client will simply get the job again the next time.
+
+    :param job_id: Job ID
+    :type job_id: str
+    :param status: The HTTP status code to return
+    :type status: int
+
+    :rtype: Tuple[Job, int, Dict[str, str]]
+    """
+    with _job_store:
+        version = _job_store.get_job_version(job_id)
+        job = _job_store.get_job(job_id)
         if not job:
             flask.abort(404, "Job not found")
 
-        return _internal_job_to_rest_job(job), 200
+        etag = _job_etag(job_id, version)
+        return _internal_job_to_rest_job(job), status, {'ETag': '"%s"' % etag}
+
+
+def _job_etag(job_id, version):
+    """
+    Return the entity tag for a version of a job.
+
+    :param job_id: Job ID
+    :type job_id: str
+    :param version: The version of the job
+    :type version: int
+
+    :rtype: str
+    """
+    return '%s-%d' % (job_id, version)
+
+
+def _not_modified(etag):
+    """
+    Make a 304 Not Modified response.
+
+    :param etag: The (unquoted) entity tag of the resource
+    :type etag: str
+
+    :rtype: flask.Response
+    """
+    return flask.Response(status=304, headers={'ETag': '"%s"' % etag})
 
 
-def get_job_log_by_id(jobId):
+def get_job_log_by_id(jobId, offset=None, length=None):
     """
     Log of a job
+    Returns the log, or a part of it if offset and/or length are given,
+    or if the request has a Range header.
 
     :param jobId: Job ID
     :type jobId: str
+    :param offset: Position in bytes to start at
+    :type offset: int
+    :param length: Maximum number of bytes to return
+    :type length: int
 
     :rtype: str
     """
     with _job_store:
-        job = _job_store.get_job(jobId)
-        if not job:
+        if _job_store.get_job_version(jobId) is None:
             flask.abort(404, "Job not found")
-        return job.log
+        log_size = _job_store.log_size(jobId)
+
+    start, end = 0, log_size
+    partial = False
+    if offset is not None or length is not None:
+        start = min(offset or 0, log_size)
+        if length is not None:
+            end = min(start + length, log_size)
+        # Nothing new to send is the normal case when following a log,
+        # and there is no Content-Range for an empty part, so send an
+        # empty body with the whole log's status rather than a 206.
+        partial = start < end
+    elif 'Range' in flask.request.headers:
+        try:
+            byte_range = parse_byte_range(flask.request.headers['Range'], log_size)
+        except ValueError:
+            return flask.Response(status=416, headers={
+                'Content-Range': 'bytes */%d' % log_size})
+        if byte_range is not None:
+            start, end = byte_range
+            partial = True
 
+    response = flask.Response(
+            _stream_log(jobId, start, end),
+            status=206 if partial else 200,
+            mimetype='text/plain')
+    response.headers['Accept-Ranges'] = 'bytes'
+    if partial:
+        response.headers['Content-Range'] = 'bytes %d-%d/%d' % (
+                start, end - 1, log_size)
+    return response
 
-def get_jobs():
+
+def _stream_log(job_id, start, end):
+    """
+    Generate the given part of a job's log, piece by piece.
+
+    The store is only held while reading a piece, not while sending
+    it to the client.
+
+    :param job_id: Job ID
+    :type job_id: str
+    :param start: Position of the first byte to send
+    :type start: int
+    :param end: Position one past the last byte to send
+    :type end: int
+
+    :rtype: Iterable[bytes]
+    """
+    position = start
+    while position < end:
+        with _job_store:
+            data = _job_store.read_log(
+                    job_id, position, min(position + _log_chunk_size, end))
+        if len(data) == 0:
+            return
+        position += len(data)
+        yield data
+
+
+def get_jobs(limit=None, offset=None, state=None, name=None):
     """
     list of jobs
     get a list of all jobs, running, cancelled, or otherwise.
+    :param limit: Maximum number of jobs to return
+    :type limit: int
+    :param offset: Number of jobs to skip
+    :type offset: int
+    :param state: Only return jobs in this (CWL) state
+    :type state: str
+    :param name: Only return jobs with this name
+    :type name: str
 
     :rtype: List[Job]
     """
+    states = _internal_states(state)
 
     with _job_store:
-        job_list = _job_store.list_jobs()
-        return [_internal_job_to_rest_job(job) for job in job_list]
+        # The list has changed if a job was added, removed or
+        # modified, so the tag is made from all ids and versions.
+        versions = _job_store.list_job_versions(
+                states=states, name=name, limit=limit, offset=offset)
+        etag = hashlib.sha256(''.join(
+                ['%s-%d;' % job_version for job_version in versions]
+                ).encode('utf-8')).hexdigest()
+        if flask.request.if_none_match.contains_weak(etag):
+            return _not_modified(etag)
+
+        job_list = _job_store.list_jobs(
+                states=states, name=name, limit=limit, offset=offset)
+        return [_internal_job_to_rest_job(job) for job in job_list], 200, {'ETag': '"%s"' % etag}
 
 def post_job(body):
     """
@@ -134,5 +355,29 @@ def post_job(body):
         job_id = _job_store.create_job(
                 body.name, body.workflow, json.dumps(body.input))
 
-        job = _job_store.get_job(job_id)
-        return _internal_job_to_rest_job(job), 201
+    return _job_response(job_id, 201)
+
+
+def post_jobs_batch(body):
+    """
+    submit several new jobs
+    Submit several new jobs at once. The jobs are created in a single
+    transaction, so either all of them are created, or none are.
+    :param body: Job descriptions, one for each job.
+    :type body: List[dict]
+
+    :rtype: List[Job]
+    """
+    if connexion.request.is_json:
+        body = [JobDescription.from_dict(job_description)
+                for job_description in connexion.request.get_json()]
+
+    with _job_store:
+        job_ids = _job_store.create_jobs([
+                (job_description.name, job_description.workflow,
+                    json.dumps(job_description.input))
+                for job_description in body])
+
+    with _job_store:
+        return [_internal_job_to_rest_job(_job_store.get_job(job_id))
+                for job_id in job_ids], 201
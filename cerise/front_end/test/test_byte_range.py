@@ -0,0 +1,23 @@
+from cerise.front_end.byte_range import parse_byte_range
+
+import pytest
+
+def test_parse_byte_range():
+    assert parse_byte_range('bytes=0-9', 100) == (0, 10)
+    assert parse_byte_range('bytes=90-', 100) == (90, 100)
+    assert parse_byte_range('bytes=-10', 100) == (90, 100)
+    assert parse_byte_range('bytes=-200', 100) == (0, 100)
+    assert parse_byte_range('bytes=50-200', 100) == (50, 100)
+
+def test_parse_ignored_byte_range():
+    assert parse_byte_range('bytes=-', 100) is None
+    assert parse_byte_range('bytes=0-9,20-29', 100) is None
+    assert parse_byte_range('lines=0-9', 100) is None
+
+def test_parse_unsatisfiable_byte_range():
+    with pytest.raises(ValueError):
+        parse_byte_range('bytes=100-', 100)
+    with pytest.raises(ValueError):
+        parse_byte_range('bytes=10-5', 100)
+    with pytest.raises(ValueError):
+        parse_byte_range('bytes=-10', 0)
@@ -44,6 +44,10 @@ class InMemoryJob:
         """Union[bytes, NoneType]: The content of the workflow
         description file, or None if it has not been resolved yet.
         """
+        self.workflow_json = None
+        """Union[str, NoneType]: The parsed workflow, serialised
+        as JSON, or None if it has not been resolved yet.
+        """
 
         # Post-staging data
         self.remote_workdir_path = ''
@@ -67,6 +71,35 @@ class InMemoryJob:
         self.remote_job_id = None
         """str: The id the remote scheduler gave to this job."""
 
+    @property
+    def log_size(self):
+        """int: The length of the log in bytes, UTF-8 encoded."""
+        return len(self.log.encode('utf-8'))
+
+    def append_log(self, text):
+        """Adds text to the end of the log.
+
+        Args:
+            text (str): The text to add.
+        """
+        self.log += text
+
+    def read_log(self, offset=0, length=None):
+        """Returns part of the log.
+
+        Args:
+            offset (int): Position of the first byte to return.
+            length (int): Number of bytes to return, or None to read
+                until the end.
+
+        Returns:
+            bytes: The requested part of the UTF-8 encoded log.
+        """
+        data = self.log.encode('utf-8')
+        if length is None:
+            return data[offset:]
+        return data[offset:offset + length]
+
     def try_transition(self, from_state, to_state):
         """Attempts to transition the job's state to a new one.
 
@@ -85,3 +118,21 @@ class InMemoryJob:
             self.state = to_state
             return True
         return False
+
+    def apply_event(self, event):
+        """Applies an event to the job.
+
+        If the job is in a state affected by the event, it moves to
+        the next state given by JobState.transitions().
+
+        Args:
+            event (JobEvent): The event to apply
+
+        Returns:
+            True iff the job's state changed.
+        """
+        transitions = JobState.transitions(event)
+        if self.state in transitions:
+            self.state = transitions[self.state]
+            return True
+        return False
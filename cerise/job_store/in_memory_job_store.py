@@ -1,4 +1,5 @@
 from .in_memory_job import InMemoryJob
+from .job_event import JobEvent
 from .job_store import JobStore
 
 import threading
@@ -58,13 +59,109 @@ class InMemoryJobStore(JobStore):
 
         return job_id
 
-    def list_jobs(self):
-        """Return a list of all currently known jobs.
+    def create_jobs(self, job_descriptions):
+        """Create several jobs at once.
+
+        Args:
+            job_descriptions (Iterable[Tuple[str, str, str]]): For
+                each job, a (name, workflow, job_input) tuple, with
+                the same meaning as for create_job().
+
+        Returns:
+            List[str]: The ids of the new jobs, in the same order.
+        """
+        return [self.create_job(name, workflow, job_input)
+                for name, workflow, job_input in job_descriptions]
+
+    def list_jobs(self, states=None, please_delete=None, name=None,
+                  limit=None, offset=None, job_ids=None):
+        """Return a list of currently known jobs.
+
+        If states, please_delete, name and/or job_ids are given, only
+        jobs matching all of the given criteria are returned.
+
+        Jobs are returned in the order in which they were created.
+
+        Args:
+            states (Iterable[JobState]): Only return jobs in any of
+                these states.
+            please_delete (bool): Only return jobs whose
+                please_delete flag has this value.
+            name (str): Only return jobs with this name.
+            limit (int): Return at most this many jobs.
+            offset (int): Skip this many matching jobs.
+            job_ids (Iterable[str]): Only return jobs with these ids.
+                Ids of jobs that do not exist are ignored.
 
         Returns:
             List[InMemoryJob]: A list of InMemoryJob objects.
         """
-        return self._jobs
+        jobs = self._jobs
+        if job_ids is not None:
+            job_ids = set(job_ids)
+            jobs = [job for job in jobs if job.id in job_ids]
+        if states is not None:
+            states = list(states)
+            jobs = [job for job in jobs if job.state in states]
+        if please_delete is not None:
+            jobs = [job for job in jobs if job.please_delete == please_delete]
+        if name is not None:
+            jobs = [job for job in jobs if job.name == name]
+        if offset is not None:
+            jobs = jobs[offset:]
+        if limit is not None:
+            jobs = jobs[:limit]
+        return jobs
+
+    def apply_event(self, event, job_ids=None, states=None, name=None):
+        """Apply an event to a set of jobs.
+
+        Each selected job in a state affected by the event is moved
+        to the next state given by JobState.transitions(). If no
+        criteria are given, the event is applied to all jobs.
+
+        Args:
+            event (JobEvent): The event to apply.
+            job_ids (Iterable[str]): Only apply to jobs with these ids.
+            states (Iterable[JobState]): Only apply to jobs in any of
+                these states.
+            name (str): Only apply to jobs with this name.
+
+        Returns:
+            int: The number of jobs whose state changed.
+        """
+        return len([job for job in self._select_jobs(job_ids, states, name)
+                    if job.apply_event(event)])
+
+    def cancel_jobs(self, job_ids=None, states=None, name=None):
+        """Cancel a set of jobs.
+
+        This applies JobEvent.CANCEL, see apply_event().
+
+        Args:
+            job_ids (Iterable[str]): Only cancel jobs with these ids.
+            states (Iterable[JobState]): Only cancel jobs in any of
+                these states.
+            name (str): Only cancel jobs with this name.
+
+        Returns:
+            int: The number of jobs cancelled.
+        """
+        return self.apply_event(JobEvent.CANCEL, job_ids, states, name)
+
+    def delete_jobs(self, job_ids=None, states=None, name=None):
+        """Cancel a set of jobs and mark them for deletion.
+
+        This takes the same arguments as cancel_jobs().
+
+        Returns:
+            int: The number of jobs marked for deletion.
+        """
+        jobs = self._select_jobs(job_ids, states, name)
+        for job in jobs:
+            job.apply_event(JobEvent.CANCEL)
+            job.please_delete = True
+        return len(jobs)
 
     def get_job(self, job_id):
         """Return the job with the given id.
@@ -89,3 +186,22 @@ class InMemoryJobStore(JobStore):
             job_id (str): A string containing the id of the job to be deleted.
         """
         self._jobs = [job for job in self._jobs if job.id != job_id]
+
+    def _select_jobs(self, job_ids, states, name):
+        """Return the jobs matching the given criteria.
+
+        See cancel_jobs() for a description of the arguments.
+
+        Returns:
+            List[InMemoryJob]: The matching jobs.
+        """
+        jobs = self._jobs
+        if job_ids is not None:
+            job_ids = set(job_ids)
+            jobs = [job for job in jobs if job.id in job_ids]
+        if states is not None:
+            states = list(states)
+            jobs = [job for job in jobs if job.state in states]
+        if name is not None:
+            jobs = [job for job in jobs if job.name == name]
+        return jobs
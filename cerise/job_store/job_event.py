@@ -0,0 +1,23 @@
+from enum import Enum
+
+class JobEvent(Enum):
+    """Enum JobEvent
+
+    Things that happen to a job, and which change its state. See
+    JobState.transitions() for the state changes for each event.
+    """
+    # Requested by the user
+    CANCEL = "Cancel"
+
+    # Done by the back-end
+    PICK_UP = "PickUp"
+    ABORT_STAGING_IN = "AbortStagingIn"
+    START = "Start"
+    DESTAGED_SUCCESS = "DestagedSuccess"
+    DESTAGED_TEMPORARY_FAILURE = "DestagedTemporaryFailure"
+    DESTAGED_PERMANENT_FAILURE = "DestagedPermanentFailure"
+    DESTAGED_SYSTEM_ERROR = "DestagedSystemError"
+
+    # Reported by the remote resource
+    REMOTE_RUNNING = "RemoteRunning"
+    REMOTE_DONE = "RemoteDone"
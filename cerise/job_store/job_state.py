@@ -1,3 +1,5 @@
+from .job_event import JobEvent
+
 from enum import Enum
 
 class JobState(Enum):
@@ -79,6 +81,67 @@ class JobState(Enum):
                          JobState.RUNNING,
                          JobState.RUNNING_CR]
 
+    @staticmethod
+    def transitions(event):
+        """Return the state changes caused by an event.
+
+        A job in one of the keys of the returned dict moves to the
+        corresponding state when the event occurs. Jobs in any other
+        state are not affected. No state is both a key and a value,
+        so the changes can be applied to many jobs in one go.
+
+        Args:
+            event (JobEvent): The event that occurred.
+
+        Returns:
+            Dict[JobState, JobState]: Maps the state a job is in to
+            the state it moves to.
+        """
+        def destaged(result):
+            return {
+                JobState.STAGING_OUT: result,
+                JobState.STAGING_OUT_CR: JobState.CANCELLED,
+            }
+
+        transition_table = {
+            JobEvent.CANCEL: {
+                JobState.SUBMITTED: JobState.CANCELLED,
+                JobState.STAGING_IN: JobState.STAGING_IN_CR,
+                JobState.WAITING: JobState.WAITING_CR,
+                JobState.RUNNING: JobState.RUNNING_CR,
+                JobState.FINISHED: JobState.CANCELLED,
+                JobState.STAGING_OUT: JobState.STAGING_OUT_CR,
+            },
+
+            JobEvent.PICK_UP: {
+                JobState.SUBMITTED: JobState.STAGING_IN,
+                JobState.FINISHED: JobState.STAGING_OUT,
+            },
+            JobEvent.ABORT_STAGING_IN: {
+                JobState.STAGING_IN_CR: JobState.CANCELLED,
+            },
+            JobEvent.START: {
+                JobState.STAGING_IN: JobState.WAITING,
+                JobState.STAGING_IN_CR: JobState.WAITING_CR,
+            },
+            JobEvent.DESTAGED_SUCCESS: destaged(JobState.SUCCESS),
+            JobEvent.DESTAGED_TEMPORARY_FAILURE: destaged(JobState.TEMPORARY_FAILURE),
+            JobEvent.DESTAGED_PERMANENT_FAILURE: destaged(JobState.PERMANENT_FAILURE),
+            JobEvent.DESTAGED_SYSTEM_ERROR: destaged(JobState.SYSTEM_ERROR),
+
+            JobEvent.REMOTE_RUNNING: {
+                JobState.WAITING: JobState.RUNNING,
+                JobState.WAITING_CR: JobState.RUNNING_CR,
+            },
+            JobEvent.REMOTE_DONE: {
+                JobState.WAITING: JobState.FINISHED,
+                JobState.RUNNING: JobState.FINISHED,
+                JobState.WAITING_CR: JobState.CANCELLED,
+                JobState.RUNNING_CR: JobState.CANCELLED,
+            },
+        }
+        return transition_table[event]
+
     @staticmethod
     def to_cwl_state_string(state):
         """Return a string containing the CWL state corresponding to
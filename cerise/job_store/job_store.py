@@ -20,14 +20,89 @@ class JobStore:
         """
         raise NotImplementedError()
 
-    def list_jobs(self):
-        """Return a list of all currently known Jobs.
+    def create_jobs(self, job_descriptions):
+        """Create several jobs at once.
+
+        Args:
+            job_descriptions (Iterable[Tuple[str, str, str]]): For
+                each job, a (name, workflow, job_input) tuple, with
+                the same meaning as for create_job().
+
+        Returns:
+            List[str]: The ids of the new jobs, in the same order.
+        """
+        raise NotImplementedError()
+
+    def list_jobs(self, states=None, please_delete=None, name=None,
+                  limit=None, offset=None, job_ids=None):
+        """Return a list of currently known Jobs.
+
+        If states, please_delete, name and/or job_ids are given, only
+        jobs matching all of the given criteria are returned.
+
+        Jobs are returned in the order in which they were created.
+
+        Args:
+            states (Iterable[JobState]): Only return jobs in any of
+                these states.
+            please_delete (bool): Only return jobs whose
+                please_delete flag has this value.
+            name (str): Only return jobs with this name.
+            limit (int): Return at most this many jobs.
+            offset (int): Skip this many matching jobs.
+            job_ids (Iterable[str]): Only return jobs with these ids.
+                Ids of jobs that do not exist are ignored.
 
         Returns:
             List[Job]: A list of jobs.
         """
         raise NotImplementedError()
 
+    def apply_event(self, event, job_ids=None, states=None, name=None):
+        """Apply an event to a set of jobs.
+
+        Each selected job in a state affected by the event is moved
+        to the next state given by JobState.transitions(). If no
+        criteria are given, the event is applied to all jobs.
+
+        Args:
+            event (JobEvent): The event to apply.
+            job_ids (Iterable[str]): Only apply to jobs with these ids.
+            states (Iterable[JobState]): Only apply to jobs in any of
+                these states.
+            name (str): Only apply to jobs with this name.
+
+        Returns:
+            int: The number of jobs whose state changed.
+        """
+        raise NotImplementedError()
+
+    def cancel_jobs(self, job_ids=None, states=None, name=None):
+        """Cancel a set of jobs.
+
+        This applies JobEvent.CANCEL, see apply_event().
+
+        Args:
+            job_ids (Iterable[str]): Only cancel jobs with these ids.
+            states (Iterable[JobState]): Only cancel jobs in any of
+                these states.
+            name (str): Only cancel jobs with this name.
+
+        Returns:
+            int: The number of jobs cancelled.
+        """
+        raise NotImplementedError()
+
+    def delete_jobs(self, job_ids=None, states=None, name=None):
+        """Cancel a set of jobs and mark them for deletion.
+
+        This takes the same arguments as cancel_jobs().
+
+        Returns:
+            int: The number of jobs marked for deletion.
+        """
+        raise NotImplementedError()
+
     def get_job(self, job_id):
         """Return the job with the given id.
 
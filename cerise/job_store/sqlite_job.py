@@ -7,15 +7,20 @@ class SQLiteJob:
     and a Xenon Job class, which represents a job running on the remote
     compute resource.
     """
-    def __init__(self, store, job_id):
+    def __init__(self, store, job_id, row=None):
         """Creates a new SQLiteJob object.
 
         This contains only a job id and a reference to the store; the
         data about the job are in the database.
 
+        If a row is given, the job is created in loaded mode, see
+        load().
+
         Args:
             store (SQLiteJobStore): The store this job is stored by
             id (str): The id of the job, a string containing a GUID
+            row (Dict[str, Any]): The job's row of the jobs table,
+                with column names as keys
         """
         self._store = store
         """SQLiteJobStore: A reference to the store this job is in."""
@@ -23,6 +28,49 @@ class SQLiteJob:
         self.id = job_id
         """str: Job id, a string containing a UUID."""
 
+        self._row = None
+        """Union[Dict[str, Any], NoneType]: Snapshot of the job's row,
+        or None if the job is not loaded."""
+
+        self._dirty = set()
+        """Set[str]: Columns changed in the snapshot but not yet saved."""
+
+        if row is not None:
+            self._row = dict(row)
+
+    def load(self):
+        """Loads the job's data from the database in one go.
+
+        After loading, properties are read from a snapshot of the
+        job's row, rather than with a query per property. Changes
+        are recorded in the snapshot, and written back by save().
+        Calling load() on a loaded job saves any pending changes and
+        then refreshes the snapshot.
+        """
+        self.save()
+        res = self._store._thread_local_data.conn.execute("""
+            SELECT * FROM jobs WHERE job_id = ?""", (self.id,))
+        columns = [column[0] for column in res.description]
+        self._row = dict(zip(columns, res.fetchone()))
+
+    def save(self):
+        """Writes any changes made to a loaded job back to the
+        database, using a single UPDATE.
+
+        Does nothing if the job is not loaded, or if nothing changed.
+        The change is committed together with the rest of the unit
+        of work, see SQLiteJobStore.
+        """
+        if not self._dirty:
+            return
+        columns = sorted(self._dirty)
+        assignments = ', '.join(['%s = ?' % column for column in columns])
+        values = [self._row[column] for column in columns]
+        self._store._thread_local_data.conn.execute("""
+            UPDATE jobs SET %s WHERE job_id = ?""" % assignments,
+            values + [self.id])
+        self._dirty.clear()
+
     # General description
     @property
     def name(self):
@@ -48,7 +96,6 @@ class SQLiteJob:
         """JobState: Current state of the job.
         """
         state_str = self._get_var('state')
-        ret = JobState[state_str]
         return JobState[state_str]
 
     @state.setter
@@ -69,12 +116,55 @@ class SQLiteJob:
     @property
     def log(self):
         """str: Log output as of last update.
+
+        The log is stored separately from the rest of the job, as a
+        sequence of chunks. Setting it replaces all of them.
         """
-        return self._get_var('log')
+        return self.read_log().decode('utf-8')
 
     @log.setter
     def log(self, value):
-        self._set_var('log', value)
+        self._store._thread_local_data.conn.execute("""
+            DELETE FROM job_logs WHERE job_id = ?""", (self.id,))
+        self.append_log(value)
+
+    @property
+    def log_size(self):
+        """int: The length of the log in bytes, UTF-8 encoded.
+        """
+        return self._store.log_size(self.id)
+
+    def append_log(self, text):
+        """Adds text to the end of the log.
+
+        Only the new text is written, as a new chunk.
+
+        Args:
+            text (str): The text to add.
+        """
+        content = text.encode('utf-8')
+        if len(content) == 0:
+            return
+        self._store._thread_local_data.conn.execute("""
+            INSERT INTO job_logs (job_id, position, content)
+            VALUES (?, ?, ?)""", (self.id, self.log_size, content))
+
+    def read_log(self, offset=0, length=None):
+        """Returns part of the log.
+
+        Only the chunks overlapping the requested range are read.
+
+        Args:
+            offset (int): Position of the first byte to return.
+            length (int): Number of bytes to return, or None to read
+                until the end.
+
+        Returns:
+            bytes: The requested part of the UTF-8 encoded log. This
+            may be shorter than length if the log ends earlier.
+        """
+        end = None if length is None else offset + length
+        return self._store.read_log(self.id, offset, end)
 
 
     @property
@@ -100,6 +190,17 @@ class SQLiteJob:
     def workflow_content(self, value):
         self._set_var('workflow_content', value)
 
+    @property
+    def workflow_json(self):
+        """Union[str, NoneType]: The parsed workflow, serialised
+        as JSON, or None if it has not been resolved yet.
+        """
+        return self._get_var('workflow_json')
+
+    @workflow_json.setter
+    def workflow_json(self, value):
+        self._set_var('workflow_json', value)
+
 
     # Post-staging data
     @property
@@ -193,17 +294,68 @@ class SQLiteJob:
             from_state (JobState): The expected current state
             to_state (JobState): The desired next state
 
+        This commits any pending changes to the job, see
+        SQLiteJobStore.
+
         Returns:
             True iff the transition was successful.
         """
+        self.save()
         res = self._store._thread_local_data.conn.execute("""
             UPDATE jobs SET state = ? WHERE job_id = ? AND state = ?;""",
             (to_state.name, self.id, from_state.name))
         self._store._thread_local_data.conn.commit()
+        success = res.rowcount == 1
+
+        if self._row is not None:
+            if success:
+                self._row['state'] = to_state.name
+            else:
+                # Someone else changed the state, so our snapshot
+                # is out of date.
+                res = self._store._thread_local_data.conn.execute("""
+                    SELECT state FROM jobs WHERE job_id = ?""", (self.id,))
+                self._row['state'] = res.fetchone()[0]
+
+        return success
+
+    def apply_event(self, event):
+        """Applies an event to the job.
+
+        If the job is in a state affected by the event, it moves to
+        the next state given by JobState.transitions(). This is done
+        in a single statement, whatever the current state is.
+
+        Like try_transition(), this commits any pending changes to
+        the job, see SQLiteJobStore.
+
+        Args:
+            event (JobEvent): The event to apply
+
+        Returns:
+            True iff the job's state changed.
+        """
+        self.save()
+        assignment, params, from_states = \
+                self._store._transition_assignment(event)
+        res = self._store._thread_local_data.conn.execute("""
+            UPDATE jobs SET %s WHERE job_id = ? AND state IN (%s);""" % (
+                assignment, ', '.join(['?'] * len(from_states))),
+            params + [self.id] + [state.name for state in from_states])
+        self._store._thread_local_data.conn.commit()
+
+        if self._row is not None:
+            res2 = self._store._thread_local_data.conn.execute("""
+                SELECT state FROM jobs WHERE job_id = ?""", (self.id,))
+            self._row['state'] = res2.fetchone()[0]
+
         return res.rowcount == 1
 
     def _get_var(self, var):
         """Do NOT feed this user input for var. Static strings only."""
+        if self._row is not None:
+            return self._row[var]
+
         res = self._store._thread_local_data.conn.execute("""
             SELECT %s FROM jobs WHERE job_id = ?""" % var,
             (self.id,))
@@ -211,7 +363,12 @@ class SQLiteJob:
 
     def _set_var(self, var, value):
         """Do NOT feed this user input for var. Static strings only."""
+        if self._row is not None:
+            if self._row[var] != value:
+                self._row[var] = value
+                self._dirty.add(var)
+            return
+
         self._store._thread_local_data.conn.execute("""
             UPDATE jobs SET %s = ? WHERE job_id = ?""" % var,
             (value, self.id))
-        self._store._thread_local_data.conn.commit()
@@ -1,9 +1,11 @@
 from .sqlite_job import SQLiteJob
 from .job_store import JobStore
+from .job_event import JobEvent
 from .job_state import JobState
 
 import sqlite3
 import threading
+import time
 from uuid import uuid4
 
 class SQLiteJobStore(JobStore):
@@ -21,14 +23,53 @@ class SQLiteJobStore(JobStore):
     can call other functions that use the store and acquire
     it themselves without incident.
 
+    The outermost with statement is a unit of work. Within it,
+    get_job() returns the same SQLiteJob object for the same
+    job, and changes to jobs are collected and committed in a
+    single transaction when the block exits. If it exits with an
+    exception, the changes are rolled back instead. State
+    transitions of a single job are the exception:
+    SQLiteJob.try_transition() and SQLiteJob.apply_event() are used
+    to synchronise the front-end and the back-end, so they commit
+    immediately, together with any changes made to the job before
+    them.
+
+    The front-end and the back-end access the database at the same
+    time from different processes. By default, the database is put
+    in write-ahead log mode, so that readers and the writer do not
+    block each other.
+
     Args:
         dbfile (str): The path to the file storing the database.
+        journal_mode (str): The SQLite journal mode to use, e.g.
+            'wal' or 'delete'.
+        synchronous (str): The SQLite synchronous setting to use,
+            one of 'off', 'normal', 'full' or 'extra'.
+        busy_timeout (float): Time in seconds to wait for a lock
+            held by another connection before giving up.
+        poll_interval (float): Time in seconds between checks for
+            changes in wait_for_change() and wait_for_job_change().
     """
 
-    def __init__(self, dbfile):
+    def __init__(self, dbfile, journal_mode='wal', synchronous='normal',
+                 busy_timeout=5.0, poll_interval=0.25):
+        if journal_mode.lower() not in _journal_modes:
+            raise ValueError('Invalid SQLite journal mode: ' + journal_mode)
+        if synchronous.lower() not in _synchronous_settings:
+            raise ValueError('Invalid SQLite synchronous setting: ' + synchronous)
+
         self._db_file = dbfile
         """The location of the database file."""
 
+        self._synchronous = synchronous.lower()
+        """The SQLite synchronous setting for our connections."""
+
+        self._busy_timeout = busy_timeout
+        """Time in seconds to wait for a lock before giving up."""
+
+        self._poll_interval = poll_interval
+        """Default time in seconds between checks for changes."""
+
         self._pool_lock = threading.RLock()
         """A lock protecting the connection pool."""
 
@@ -37,32 +78,82 @@ class SQLiteJobStore(JobStore):
 
         self._thread_local_data = threading.local()
         """Thread-local data, for storing current connection in
-        acquired stores. That will be in self._thread_local_data.conn
+        acquired stores. That will be in self._thread_local_data.conn,
+        and the jobs obtained within the current unit of work will be
+        in self._thread_local_data.jobs.
         """
 
-        conn = sqlite3.connect(self._db_file)
-        conn.execute("""CREATE TABLE IF NOT EXISTS jobs(
-                job_id CHARACTER(32),
-                name VARCHAR(255),
-                workflow VARCHAR(255),
-                local_input TEXT,
-                state VARCHAR(17) DEFAULT 'SUBMITTED',
-                log TEXT DEFAULT '',
-                remote_output TEXT DEFAULT '',
-                workflow_content BLOB,
-                remote_workdir_path VARCHAR(255) DEFAULT '',
-                remote_workflow_path VARCHAR(255) DEFAULT '',
-                remote_input_path VARCHAR(255) DEFAULT '',
-                remote_stdout_path VARCHAR(255) DEFAULT '',
-                remote_stderr_path VARCHAR(255) DEFAULT '',
-                remote_job_id VARCHAR(255),
-                local_output TEXT DEFAULT '',
-                please_delete INTEGER DEFAULT 0
-                )
-                """)
-        conn.commit()
+        conn = self._connect(None)
+        conn.execute('PRAGMA journal_mode = %s' % journal_mode.lower())
         conn.close()
 
+        self._migrate()
+
+    @staticmethod
+    def from_config(db_config):
+        """Create a store as described by a configuration.
+
+        Settings that are not in the configuration get the defaults
+        of the constructor.
+
+        Args:
+            db_config (Dict[str, Any]): The database section of the
+                configuration, with a 'file' key, and optionally
+                'journal-mode', 'synchronous', 'busy-timeout' and
+                'poll-interval'.
+
+        Returns:
+            SQLiteJobStore: The new store.
+        """
+        options = {}
+        for key, argument in _config_options:
+            if key in db_config:
+                options[argument] = db_config[key]
+        return SQLiteJobStore(db_config['file'], **options)
+
+    def _connect(self, isolation_level):
+        """Open a new connection to the database, and configure it.
+
+        Connections are pooled, and may be used by a different thread
+        than the one that created them, but never by two threads at
+        the same time, see __enter__().
+
+        Args:
+            isolation_level (Union[str, NoneType]): The isolation
+                level to pass to sqlite3.connect().
+
+        Returns:
+            sqlite3.Connection: The new connection.
+        """
+        conn = sqlite3.connect(self._db_file, timeout=self._busy_timeout,
+                isolation_level=isolation_level, check_same_thread=False)
+        conn.execute('PRAGMA synchronous = %s' % self._synchronous)
+        return conn
+
+    def _migrate(self):
+        """Brings the database schema up to date.
+
+        The schema version is kept in SQLite's user_version. Each
+        migration in _migrations is applied in its own transaction,
+        after checking the version again, so that several processes
+        starting up at the same time can safely do this concurrently.
+        """
+        conn = self._connect(None)
+        try:
+            for version, migration in enumerate(_migrations, 1):
+                conn.execute('BEGIN IMMEDIATE')
+                current_version = conn.execute('PRAGMA user_version').fetchone()[0]
+                if current_version >= version:
+                    conn.execute('ROLLBACK')
+                    continue
+
+                for statement in migration:
+                    conn.execute(statement)
+                conn.execute('PRAGMA user_version = %d' % version)
+                conn.execute('COMMIT')
+        finally:
+            conn.close()
+
     def __enter__(self):
         """Grabs a connection from the shared connection pool, and
         puts it in thread-local storage, thus reserving it for the
@@ -81,8 +172,9 @@ class SQLiteJobStore(JobStore):
             if self._connection_pool != []:
                 self._thread_local_data.conn = self._connection_pool.pop()
             else:
-                self._thread_local_data.conn = sqlite3.connect(self._db_file, isolation_level="IMMEDIATE")
+                self._thread_local_data.conn = self._connect("IMMEDIATE")
 
+            self._thread_local_data.jobs = {}
             self._thread_local_data.recursion_depth = 1
 
             self._pool_lock.release()
@@ -91,22 +183,102 @@ class SQLiteJobStore(JobStore):
             self._thread_local_data.recursion_depth += 1
 
     def __exit__(self, exc_type, exc_value, traceback):
-        """Returns the connection back to the pool.
+        """Commits the unit of work, and returns the connection
+        back to the pool.
+
+        If the outermost with statement exits due to an exception,
+        any uncommitted changes are rolled back instead.
         """
         if self._thread_local_data.recursion_depth == 1:
-            self._pool_lock.acquire()
+            jobs = self._thread_local_data.__dict__.pop('jobs')
+            connection = self._thread_local_data.conn
+
+            try:
+                if exc_type is None:
+                    for job in jobs.values():
+                        job.save()
+                    connection.commit()
+            finally:
+                # Roll back any open transaction so we don't keep the DB
+                # locked forever if an error occurs.
+                connection.rollback()
+
+                self._pool_lock.acquire()
+                del self._thread_local_data.conn
+                self._connection_pool.append(connection)
+                self._pool_lock.release()
 
-            connection = self._thread_local_data.__dict__.pop('conn')
+        self._thread_local_data.recursion_depth -= 1
 
-            # Roll back any open transaction so we don't keep the DB
-            # locked forever if an error occurs.
-            connection.rollback()
+    def get_change_count(self):
+        """Return the current value of the change counter.
 
-            self._connection_pool.append(connection)
+        The counter is incremented whenever a job is created, or a
+        job's state or deletion flag changes.
 
-            self._pool_lock.release()
+        Returns:
+            int: The current change count.
+        """
+        res = self._thread_local_data.conn.execute("""
+                SELECT counter FROM changes WHERE id = 0""")
+        return res.fetchone()[0]
 
-        self._thread_local_data.recursion_depth -= 1
+    def wait_for_change(self, change_count, timeout, poll_interval=None):
+        """Wait until the change counter differs from the given value.
+
+        This polls the counter, which is a single cheap lookup, and
+        sleeps in between using time.sleep(), which cooperates with
+        gevent if it has monkey-patched the standard library. Do not
+        call this while holding the store, as that would keep other
+        threads from getting work done in the mean time.
+
+        Args:
+            change_count (int): The last change count seen by the caller.
+            timeout (float): The maximum time to wait, in seconds.
+            poll_interval (float): Time between checks, in seconds.
+                Defaults to the store's poll interval.
+
+        Returns:
+            int: The current change count.
+        """
+        if poll_interval is None:
+            poll_interval = self._poll_interval
+        deadline = time.perf_counter() + timeout
+        while True:
+            with self:
+                current_count = self.get_change_count()
+            remaining = deadline - time.perf_counter()
+            if current_count != change_count or remaining <= 0.0:
+                return current_count
+            time.sleep(min(poll_interval, remaining))
+
+    def wait_for_job_change(self, job_id, version, timeout, poll_interval=None):
+        """Wait until a job's version differs from the given value.
+
+        This works like wait_for_change(), but for a single job, and
+        the same caveats apply.
+
+        Args:
+            job_id (str): The id of the job to watch.
+            version (int): The last version of the job seen by the caller.
+            timeout (float): The maximum time to wait, in seconds.
+            poll_interval (float): Time between checks, in seconds.
+                Defaults to the store's poll interval.
+
+        Returns:
+            Union[int, NoneType]: The current version of the job, or
+            None if the job does not exist (anymore).
+        """
+        if poll_interval is None:
+            poll_interval = self._poll_interval
+        deadline = time.perf_counter() + timeout
+        while True:
+            with self:
+                current_version = self.get_job_version(job_id)
+            remaining = deadline - time.perf_counter()
+            if current_version != version or remaining <= 0.0:
+                return current_version
+            time.sleep(min(poll_interval, remaining))
 
     def create_job(self, name, workflow, job_input):
         """Create a job.
@@ -128,20 +300,144 @@ class SQLiteJobStore(JobStore):
                 INSERT INTO jobs (job_id, name, workflow, local_input, state)
                 VALUES (?, ?, ?, ?, ?)""",
                 (job_id, name, workflow, job_input, JobState.SUBMITTED.name))
-        self._thread_local_data.conn.commit()
 
         return job_id
 
-    def list_jobs(self):
-        """Return a list of all currently known jobs.
+    def create_jobs(self, job_descriptions):
+        """Create several jobs at once.
+
+        The jobs are inserted using a single statement, and like
+        create_job(), this is committed together with the rest of the
+        unit of work.
+
+        Args:
+            job_descriptions (Iterable[Tuple[str, str, str]]): For
+                each job, a (name, workflow, job_input) tuple, with
+                the same meaning as for create_job().
+
+        Returns:
+            List[str]: The ids of the new jobs, in the same order.
+        """
+        rows = [(uuid4().hex, name, workflow, job_input, JobState.SUBMITTED.name)
+                for name, workflow, job_input in job_descriptions]
+
+        self._thread_local_data.conn.executemany("""
+                INSERT INTO jobs (job_id, name, workflow, local_input, state)
+                VALUES (?, ?, ?, ?, ?)""", rows)
+
+        return [row[0] for row in rows]
+
+    def list_jobs(self, states=None, please_delete=None, name=None,
+                  limit=None, offset=None, job_ids=None):
+        """Return a list of currently known jobs.
+
+        The jobs are fetched, loaded, in a single query. If states,
+        please_delete, name and/or job_ids are given, only jobs
+        matching all of the given criteria are returned.
+
+        Jobs are returned in the order in which they were created.
+
+        Args:
+            states (Iterable[JobState]): Only return jobs in any of
+                these states.
+            please_delete (bool): Only return jobs whose
+                please_delete flag has this value.
+            name (str): Only return jobs with this name.
+            limit (int): Return at most this many jobs.
+            offset (int): Skip this many matching jobs.
+            job_ids (Iterable[str]): Only return jobs with these ids.
+                Ids of jobs that do not exist are ignored.
 
         Returns:
             List[SQLiteJob]: A list of SQLiteJob objects.
         """
+        columns, rows = self._select_jobs(
+                '*', job_ids, states, please_delete, name, limit, offset)
+        return [self._job_from_row(dict(zip(columns, row))) for row in rows]
+
+    def list_job_versions(self, states=None, please_delete=None,
+                          name=None, limit=None, offset=None, job_ids=None):
+        """Return the ids and versions of currently known jobs.
+
+        This takes the same arguments as list_jobs(), and returns the
+        same jobs in the same order, but reads only their ids and
+        version numbers.
+
+        Returns:
+            List[Tuple[str, int]]: A list of (job id, version) tuples.
+        """
+        _, rows = self._select_jobs(
+                'job_id, version', job_ids, states, please_delete, name,
+                limit, offset)
+        return rows
+
+    def get_job_version(self, job_id):
+        """Return the version number of a job.
+
+        The version number is incremented whenever anything about the
+        job changes, except for its log. This is a single lookup, so
+        it is a cheap way to find out whether a job has changed.
+
+        Args:
+            job_id (str): A string containing a job id.
+
+        Returns:
+            Union[int, NoneType]: The version, or None if there is no
+            job with that id.
+        """
+        res = self._thread_local_data.conn.execute("""
+                SELECT version FROM jobs WHERE job_id = ?""", (job_id,))
+        row = res.fetchone()
+        return None if row is None else row[0]
+
+    def log_size(self, job_id):
+        """Return the length of a job's log.
+
+        This reads only the last chunk of the log, and not the job
+        itself.
+
+        Args:
+            job_id (str): A string containing a job id.
+
+        Returns:
+            int: The length of the log in bytes, UTF-8 encoded, or 0
+            if there is no log or no job with that id.
+        """
         res = self._thread_local_data.conn.execute("""
-                SELECT job_id FROM jobs;""")
-        ret = [SQLiteJob(self, row[0]) for row in res.fetchall()]
-        return ret
+            SELECT position + length(content) FROM job_logs
+            WHERE job_id = ? ORDER BY position DESC LIMIT 1""", (job_id,))
+        row = res.fetchone()
+        return 0 if row is None else row[0]
+
+    def read_log(self, job_id, start=0, end=None):
+        """Return part of a job's log.
+
+        Only the chunks overlapping the requested range are read, and
+        not the job itself.
+
+        Args:
+            job_id (str): A string containing a job id.
+            start (int): Position of the first byte to return.
+            end (int): Position one past the last byte to return, or
+                None to read until the end.
+
+        Returns:
+            bytes: The requested part of the UTF-8 encoded log. This
+            may be shorter than requested if the log ends earlier, and
+            is empty if there is no job with that id.
+        """
+        if end is None:
+            end = self.log_size(job_id)
+        res = self._thread_local_data.conn.execute("""
+            SELECT position, content FROM job_logs
+            WHERE job_id = ? AND position < ? AND position + length(content) > ?
+            ORDER BY position""", (job_id, end, start))
+        chunks = res.fetchall()
+        if not chunks:
+            return b''
+        first_position = chunks[0][0]
+        data = b''.join([content for _, content in chunks])
+        return data[start - first_position:end - first_position]
 
     def get_job(self, job_id):
         """Return the job with the given id.
@@ -153,11 +449,16 @@ class SQLiteJobStore(JobStore):
         Returns:
             Union[SQLiteJob, NoneType]: The job object corresponding to the given id.
         """
+        if job_id in self._thread_local_data.jobs:
+            return self._thread_local_data.jobs[job_id]
+
         res = self._thread_local_data.conn.execute("""
-                SELECT COUNT(*) FROM jobs WHERE job_id = ?""", (job_id,))
-        if res.fetchone()[0] == 0:
+                SELECT * FROM jobs WHERE job_id = ?""", (job_id,))
+        row = res.fetchone()
+        if row is None:
             return None
-        return SQLiteJob(self, job_id)
+        columns = [column[0] for column in res.description]
+        return self._job_from_row(dict(zip(columns, row)))
 
     def delete_job(self, job_id):
         """Delete the job with the given id.
@@ -165,7 +466,423 @@ class SQLiteJobStore(JobStore):
         Args:
             job_id (str): A string containing the id of the job to be deleted.
         """
+        self._thread_local_data.jobs.pop(job_id, None)
         self._thread_local_data.conn.execute("""
                 DELETE FROM jobs WHERE job_id = ?""",
                 (job_id,))
-        self._thread_local_data.conn.commit()
+
+    def apply_event(self, event, job_ids=None, states=None, name=None):
+        """Apply an event to a set of jobs.
+
+        All selected jobs in a state affected by the event are moved
+        to the next state given by JobState.transitions(), using a
+        single UPDATE statement, or a few for very long lists of ids.
+        If no criteria are given, the event is applied to all jobs.
+
+        Like other changes, this is committed together with the rest
+        of the unit of work.
+
+        Args:
+            event (JobEvent): The event to apply.
+            job_ids (Iterable[str]): Only apply to jobs with these ids.
+            states (Iterable[JobState]): Only apply to jobs in any of
+                these states.
+            name (str): Only apply to jobs with this name.
+
+        Returns:
+            int: The number of jobs whose state changed.
+        """
+        return self._apply_event(event, job_ids, states, name, False)
+
+    def cancel_jobs(self, job_ids=None, states=None, name=None):
+        """Cancel a set of jobs.
+
+        This applies JobEvent.CANCEL, see apply_event(). Jobs that
+        are finished or already being cancelled are left alone.
+
+        Args:
+            job_ids (Iterable[str]): Only cancel jobs with these ids.
+            states (Iterable[JobState]): Only cancel jobs in any of
+                these states.
+            name (str): Only cancel jobs with this name.
+
+        Returns:
+            int: The number of jobs cancelled.
+        """
+        return self._apply_event(JobEvent.CANCEL, job_ids, states, name, False)
+
+    def delete_jobs(self, job_ids=None, states=None, name=None):
+        """Mark a set of jobs for deletion, cancelling them first.
+
+        This takes the same arguments as cancel_jobs(), and cancels
+        the selected jobs and sets their please_delete flag in the
+        same statement.
+
+        Returns:
+            int: The number of jobs marked for deletion.
+        """
+        return self._apply_event(JobEvent.CANCEL, job_ids, states, name, True)
+
+    def _select_jobs(self, columns, job_ids, states, please_delete, name,
+                     limit, offset):
+        """Select jobs from the database.
+
+        See list_jobs() for a description of the arguments.
+
+        Args:
+            columns (str): The columns to select, as SQL.
+
+        Returns:
+            Tuple[List[str], List[tuple]]: The names of the selected
+            columns, and the selected rows.
+        """
+        batches = _batches(job_ids)
+        if len(batches) != 1:
+            # Too many ids for one statement, so select all matching
+            # jobs batch by batch, then merge and paginate them here.
+            column_names, rows = [], []
+            for batch in batches:
+                column_names, batch_rows = self._select_jobs(
+                        'rowid, ' + columns, batch, states, please_delete,
+                        name, None, None)
+                rows.extend(batch_rows)
+            rows.sort(key=lambda row: row[0])
+            start = offset or 0
+            stop = None if limit is None else start + limit
+            return column_names[1:], [row[1:] for row in rows[start:stop]]
+
+        conditions, params = self._job_conditions(
+                batches[0], states, please_delete, name)
+
+        query = 'SELECT %s FROM jobs' % columns
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY rowid'
+        if limit is not None or offset is not None:
+            query += ' LIMIT ? OFFSET ?'
+            params.extend([-1 if limit is None else limit, offset or 0])
+
+        res = self._thread_local_data.conn.execute(query, params)
+        return [column[0] for column in res.description], res.fetchall()
+
+    def _job_conditions(self, job_ids, states, please_delete, name):
+        """Make SQL conditions selecting jobs.
+
+        See cancel_jobs() and list_jobs() for a description of the
+        arguments.
+
+        Returns:
+            Tuple[List[str], List[Any]]: A list of conditions which
+            must all hold, and a list of parameters for them.
+        """
+        conditions = []
+        params = []
+        if job_ids is not None:
+            conditions.append('job_id IN (%s)' % ', '.join(['?'] * len(job_ids)))
+            params.extend(job_ids)
+        if states is not None:
+            states = [state.name for state in states]
+            conditions.append('state IN (%s)' % ', '.join(['?'] * len(states)))
+            params.extend(states)
+        if please_delete is not None:
+            conditions.append('please_delete = ?')
+            params.append(int(please_delete))
+        if name is not None:
+            conditions.append('name = ?')
+            params.append(name)
+        return conditions, params
+
+    def _transition_assignment(self, event):
+        """Make an SQL assignment applying an event to the state.
+
+        Args:
+            event (JobEvent): The event to apply.
+
+        Returns:
+            Tuple[str, List[str], List[JobState]]: The assignment,
+            its parameters, and the states affected by the event.
+        """
+        transitions = JobState.transitions(event)
+        assignment = 'state = CASE state %s ELSE state END' % ' '.join(
+                ['WHEN ? THEN ?'] * len(transitions))
+        params = [state.name
+                  for transition in transitions.items()
+                  for state in transition]
+        return assignment, params, list(transitions)
+
+    def _apply_event(self, event, job_ids, states, name, please_delete):
+        """Apply an event to jobs, and optionally mark them for
+        deletion.
+
+        See apply_event() for a description of the arguments.
+
+        Args:
+            please_delete (bool): Whether to also set the
+                please_delete flag of the selected jobs.
+
+        Returns:
+            int: The number of jobs changed.
+        """
+        # Changes to loaded jobs must be written before the update,
+        # and their snapshots refreshed after it.
+        jobs = self._thread_local_data.jobs
+        for job in jobs.values():
+            job.save()
+
+        assignments, assignment_params, from_states = \
+                self._transition_assignment(event)
+        if please_delete:
+            assignments += ', please_delete = 1'
+        else:
+            # Only touch jobs that will change, so the count is right
+            # and other jobs do not get a new version.
+            if states is None:
+                states = JobState
+            states = [state for state in states if state in from_states]
+
+        count = 0
+        for batch in _batches(job_ids):
+            conditions, params = self._job_conditions(batch, states, None, name)
+            query = 'UPDATE jobs SET ' + assignments
+            if conditions:
+                query += ' WHERE ' + ' AND '.join(conditions)
+            res = self._thread_local_data.conn.execute(
+                    query, assignment_params + params)
+            count += res.rowcount
+
+        self._reload_jobs()
+        return count
+
+    def _reload_jobs(self):
+        """Refresh the snapshots of the jobs loaded in this unit of
+        work from the database.
+
+        Any changes to them must have been saved first.
+        """
+        jobs = self._thread_local_data.jobs
+        loaded_ids = [job_id for job_id, job in jobs.items()
+                      if job._row is not None]
+        for batch in _batches(loaded_ids):
+            conditions, params = self._job_conditions(batch, None, None, None)
+            res = self._thread_local_data.conn.execute(
+                    'SELECT * FROM jobs WHERE ' + conditions[0], params)
+            columns = [column[0] for column in res.description]
+            for row in res.fetchall():
+                row = dict(zip(columns, row))
+                jobs[row['job_id']]._row = row
+
+    def _job_from_row(self, row):
+        """Return the SQLiteJob for a row of the jobs table.
+
+        If the job has already been obtained in the current unit of
+        work, that object is returned and the row is ignored, so that
+        any changes made to it are kept.
+
+        Args:
+            row (Dict[str, Any]): A row with column names as keys.
+
+        Returns:
+            SQLiteJob: The job, in loaded mode.
+        """
+        jobs = self._thread_local_data.jobs
+        if row['job_id'] not in jobs:
+            jobs[row['job_id']] = SQLiteJob(self, row['job_id'], row)
+        return jobs[row['job_id']]
+
+
+_max_ids_per_statement = 900
+"""int: Maximum number of job ids to put into a single statement.
+Older versions of SQLite allow at most 999 parameters per statement."""
+
+def _batches(job_ids):
+    """Split a list of job ids into batches that fit in a statement.
+
+    Args:
+        job_ids (Union[Iterable[str], NoneType]): The ids to split.
+
+    Returns:
+        List[Union[List[str], NoneType]]: The batches, or [None] if
+        job_ids is None, meaning all jobs.
+    """
+    if job_ids is None:
+        return [None]
+    job_ids = list(job_ids)
+    return [job_ids[i:i + _max_ids_per_statement]
+            for i in range(0, len(job_ids), _max_ids_per_statement)]
+
+_config_options = [
+        ('journal-mode', 'journal_mode'),
+        ('synchronous', 'synchronous'),
+        ('busy-timeout', 'busy_timeout'),
+        ('poll-interval', 'poll_interval')]
+"""List[Tuple[str, str]]: Configuration keys and the corresponding
+constructor arguments."""
+
+_journal_modes = ['delete', 'truncate', 'persist', 'memory', 'wal', 'off']
+"""List[str]: Valid values for the journal_mode pragma."""
+
+_synchronous_settings = ['off', 'normal', 'full', 'extra']
+"""List[str]: Valid values for the synchronous pragma."""
+
+_job_columns_v1 = """
+        job_id, name, workflow, local_input, state, log, remote_output,
+        workflow_content, remote_workdir_path, remote_workflow_path,
+        remote_input_path, remote_stdout_path, remote_stderr_path,
+        remote_job_id, local_output, please_delete"""
+
+_job_columns_v3 = ' '.join(_job_columns_v1.split()) + ', workflow_json'
+"""str: The columns of the jobs table from version 3 on, other than
+the version number."""
+
+_migrations = [
+    # Version 1: primary key on job_id, and indexes for state scans.
+    # Databases from before versioning have the table already, so
+    # make sure it exists and then rebuild it.
+    [
+        """CREATE TABLE IF NOT EXISTS jobs(
+                job_id CHARACTER(32),
+                name VARCHAR(255),
+                workflow VARCHAR(255),
+                local_input TEXT,
+                state VARCHAR(17) DEFAULT 'SUBMITTED',
+                log TEXT DEFAULT '',
+                remote_output TEXT DEFAULT '',
+                workflow_content BLOB,
+                remote_workdir_path VARCHAR(255) DEFAULT '',
+                remote_workflow_path VARCHAR(255) DEFAULT '',
+                remote_input_path VARCHAR(255) DEFAULT '',
+                remote_stdout_path VARCHAR(255) DEFAULT '',
+                remote_stderr_path VARCHAR(255) DEFAULT '',
+                remote_job_id VARCHAR(255),
+                local_output TEXT DEFAULT '',
+                please_delete INTEGER DEFAULT 0
+                )
+                """,
+        """CREATE TABLE jobs_v1(
+                job_id CHARACTER(32) PRIMARY KEY NOT NULL,
+                name VARCHAR(255),
+                workflow VARCHAR(255),
+                local_input TEXT,
+                state VARCHAR(17) DEFAULT 'SUBMITTED',
+                log TEXT DEFAULT '',
+                remote_output TEXT DEFAULT '',
+                workflow_content BLOB,
+                remote_workdir_path VARCHAR(255) DEFAULT '',
+                remote_workflow_path VARCHAR(255) DEFAULT '',
+                remote_input_path VARCHAR(255) DEFAULT '',
+                remote_stdout_path VARCHAR(255) DEFAULT '',
+                remote_stderr_path VARCHAR(255) DEFAULT '',
+                remote_job_id VARCHAR(255),
+                local_output TEXT DEFAULT '',
+                please_delete INTEGER DEFAULT 0
+                )
+                """,
+        "INSERT INTO jobs_v1 (%s) SELECT %s FROM jobs" % (
+                _job_columns_v1, _job_columns_v1),
+        "DROP TABLE jobs",
+        "ALTER TABLE jobs_v1 RENAME TO jobs",
+        "CREATE INDEX jobs_state_idx ON jobs(state)",
+        "CREATE INDEX jobs_please_delete_idx ON jobs(please_delete, state)"
+    ],
+    # Version 2: a change counter, bumped whenever a job is added or
+    # its state or deletion flag changes, so that the back-end can
+    # wait for work instead of rescanning all jobs.
+    [
+        """CREATE TABLE changes(
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                counter INTEGER NOT NULL
+                )
+                """,
+        "INSERT INTO changes (id, counter) VALUES (0, 0)",
+        """CREATE TRIGGER jobs_insert_change AFTER INSERT ON jobs
+                BEGIN
+                    UPDATE changes SET counter = counter + 1;
+                END
+                """,
+        """CREATE TRIGGER jobs_update_change
+                AFTER UPDATE OF state, please_delete ON jobs
+                BEGIN
+                    UPDATE changes SET counter = counter + 1;
+                END
+                """
+    ],
+    # Version 3: the parsed workflow, serialised as JSON, so that it
+    # needs to be parsed as YAML only once.
+    [
+        "ALTER TABLE jobs ADD COLUMN workflow_json TEXT"
+    ],
+    # Version 4: logs in their own table, as chunks that are added
+    # as the log grows, so that neither appending to a log nor
+    # reading part of it requires handling the whole log. The old
+    # log column is left in place, but emptied.
+    [
+        """CREATE TABLE job_logs(
+                job_id CHARACTER(32) NOT NULL,
+                position INTEGER NOT NULL,
+                content BLOB NOT NULL,
+                PRIMARY KEY (job_id, position)
+                )
+                """,
+        """INSERT INTO job_logs (job_id, position, content)
+                SELECT job_id, 0, CAST(log AS BLOB) FROM jobs
+                WHERE log IS NOT NULL AND log != ''
+                """,
+        "UPDATE jobs SET log = ''",
+        """CREATE TRIGGER jobs_delete_logs AFTER DELETE ON jobs
+                BEGIN
+                    DELETE FROM job_logs WHERE job_id = old.job_id;
+                END
+                """
+    ],
+    # Version 5: an index for listing jobs by name.
+    [
+        "CREATE INDEX jobs_name_idx ON jobs(name)"
+    ],
+    # Version 6: a version number per job, incremented whenever the
+    # job's row changes, so that clients can cheaply check whether a
+    # job has changed. The WHEN clause stops the trigger from
+    # triggering itself.
+    [
+        "ALTER TABLE jobs ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+        """CREATE TRIGGER jobs_update_version AFTER UPDATE ON jobs
+                WHEN new.version = old.version
+                BEGIN
+                    UPDATE jobs SET version = old.version + 1
+                    WHERE job_id = new.job_id;
+                END
+                """
+    ],
+    # Version 7: only count updates that actually change the state or
+    # the deletion flag, rather than any update that sets them, so that
+    # rewriting an unchanged value does not wake up the back-end.
+    [
+        "DROP TRIGGER jobs_update_change",
+        """CREATE TRIGGER jobs_update_change
+                AFTER UPDATE OF state, please_delete ON jobs
+                WHEN old.state IS NOT new.state
+                    OR old.please_delete IS NOT new.please_delete
+                BEGIN
+                    UPDATE changes SET counter = counter + 1;
+                END
+                """
+    ],
+    # Version 8: only increment a job's version if a value in its row
+    # actually changed, so that rewriting unchanged values does not
+    # invalidate ETags or wake up clients waiting for a change.
+    [
+        "DROP TRIGGER jobs_update_version",
+        """CREATE TRIGGER jobs_update_version AFTER UPDATE ON jobs
+                WHEN new.version = old.version AND (%s)
+                BEGIN
+                    UPDATE jobs SET version = old.version + 1
+                    WHERE job_id = new.job_id;
+                END
+                """ % ' OR '.join([
+                        'old.%s IS NOT new.%s' % (column, column)
+                        for column in _job_columns_v3.split(', ')])
+    ]
+]
+"""List[List[str]]: Schema migrations. Entry i contains the SQL
+statements that upgrade the database from version i to version i+1.
+Only ever append to this list.
+"""
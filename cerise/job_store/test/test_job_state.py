@@ -0,0 +1,40 @@
+from cerise.job_store.job_event import JobEvent
+from cerise.job_store.job_state import JobState
+
+import pytest
+
+@pytest.mark.parametrize('event', list(JobEvent))
+def test_transitions_defined(event):
+    transitions = JobState.transitions(event)
+    assert transitions
+    for from_state, to_state in transitions.items():
+        assert isinstance(from_state, JobState)
+        assert isinstance(to_state, JobState)
+
+@pytest.mark.parametrize('event', list(JobEvent))
+def test_transitions_single_step(event):
+    # Applying all transitions at once must give the same result as
+    # trying them one by one, so no state may be both a source and a
+    # target.
+    transitions = JobState.transitions(event)
+    assert not set(transitions.keys()) & set(transitions.values())
+
+@pytest.mark.parametrize('event', list(JobEvent))
+def test_no_transitions_from_final_states(event):
+    for from_state in JobState.transitions(event):
+        assert not JobState.is_final(from_state)
+
+def test_cancel_transitions():
+    transitions = JobState.transitions(JobEvent.CANCEL)
+    for state in JobState:
+        if JobState.is_final(state) or JobState.cancellation_active(state):
+            assert state not in transitions
+        else:
+            assert state in transitions
+    for to_state in transitions.values():
+        assert to_state == JobState.CANCELLED or JobState.cancellation_active(to_state)
+
+def test_remote_transitions():
+    for event in [JobEvent.REMOTE_RUNNING, JobEvent.REMOTE_DONE]:
+        for from_state in JobState.transitions(event):
+            assert JobState.is_remote(from_state)
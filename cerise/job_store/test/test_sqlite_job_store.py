@@ -1,4 +1,5 @@
 from cerise.job_store.sqlite_job_store import SQLiteJobStore
+from cerise.job_store.job_event import JobEvent
 from cerise.job_store.job_state import JobState
 
 from cerise.test.fixture_jobs import PassJob
@@ -7,6 +8,8 @@ from cerise.test.fixture_jobs import WcJob
 import os
 import pytest
 import sqlite3
+import threading
+import time
 
 @pytest.fixture
 def db_name(request, tmpdir):
@@ -72,6 +75,25 @@ def job(request, onejob_store):
 def test_create_store(db_name):
     _ = SQLiteJobStore(db_name)
 
+def test_store_pragmas(db_name):
+    _ = SQLiteJobStore(db_name)
+    conn = sqlite3.connect(db_name)
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+def test_store_invalid_pragmas(db_name):
+    with pytest.raises(ValueError):
+        _ = SQLiteJobStore(db_name, journal_mode='wal; DROP TABLE jobs')
+    with pytest.raises(ValueError):
+        _ = SQLiteJobStore(db_name, synchronous='sometimes')
+
+def test_store_from_config(db_name):
+    store = SQLiteJobStore.from_config({'file': db_name, 'journal-mode': 'delete'})
+    assert store._busy_timeout == 5.0
+    conn = sqlite3.connect(db_name)
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+    with pytest.raises(ValueError):
+        SQLiteJobStore.from_config({'file': db_name, 'synchronous': 'sometimes'})
+
 def test_open_existing_store(empty_db):
     _ = SQLiteJobStore(empty_db['file'])
 
@@ -86,6 +108,21 @@ def test_create_job(onejob_store):
     res = onejob_store['conn'].execute("""SELECT * FROM jobs WHERE name = 'test_create_job';""")
     assert len(res.fetchall()) == 1
 
+def test_create_jobs(empty_store):
+    store = empty_store['store']
+    with store:
+        job_ids = store.create_jobs([
+                ('test_create_jobs_1', 'file:///1', '{}'),
+                ('test_create_jobs_2', 'file:///2', '{"x": 1}')])
+
+    assert len(job_ids) == 2
+    with store:
+        jobs = store.list_jobs()
+        assert [job.id for job in jobs] == job_ids
+        assert [job.name for job in jobs] == ['test_create_jobs_1', 'test_create_jobs_2']
+        assert jobs[1].local_input == '{"x": 1}'
+        assert jobs[1].state == JobState.SUBMITTED
+
 def test_list_jobs_empty(empty_store):
     with empty_store['store']:
         joblist = empty_store['store'].list_jobs()
@@ -97,6 +134,145 @@ def test_list_jobs(onejob_store):
         assert len(joblist) == 1
         assert joblist[0].name == 'test_sqlite_job_store'
 
+def test_list_jobs_filtered(onejob_store):
+    store = onejob_store['store']
+    with store:
+        job_id = store.create_job('test_list_jobs_filtered', 'file:///', '{}')
+        job = store.get_job(job_id)
+        job.state = JobState.CANCELLED
+        job.please_delete = True
+
+    with store:
+        assert len(store.list_jobs(states=[JobState.SUBMITTED])) == 1
+        assert len(store.list_jobs(states=[JobState.SUBMITTED, JobState.CANCELLED])) == 2
+        assert store.list_jobs(states=[]) == []
+        joblist = store.list_jobs(states=[JobState.CANCELLED], please_delete=True)
+        assert [job.id for job in joblist] == [job_id]
+        assert joblist[0].name == 'test_list_jobs_filtered'
+        assert store.list_jobs(states=[JobState.SUBMITTED], please_delete=True) == []
+
+def test_list_jobs_paginated(onejob_store):
+    store = onejob_store['store']
+    with store:
+        job_ids = [store.create_job('test_list_jobs_paginated', 'file:///', '{}')
+                   for _ in range(3)]
+
+    with store:
+        joblist = store.list_jobs(name='test_list_jobs_paginated')
+        assert [job.id for job in joblist] == job_ids
+        joblist = store.list_jobs(name='test_list_jobs_paginated', limit=2)
+        assert [job.id for job in joblist] == job_ids[:2]
+        joblist = store.list_jobs(name='test_list_jobs_paginated', offset=2)
+        assert [job.id for job in joblist] == job_ids[2:]
+        joblist = store.list_jobs(limit=2, offset=1)
+        assert [job.id for job in joblist] == job_ids[:2]
+        assert store.list_jobs(name='test_list_jobs_nonexistent') == []
+
+def test_job_versions(onejob_store):
+    store = onejob_store['store']
+    job_id = '258685677b034756b55bbad161b2b89b'
+    with store:
+        version = store.get_job_version(job_id)
+        assert store.list_job_versions() == [(job_id, version)]
+        assert store.get_job_version('nonexistent') is None
+
+        job = store.get_job(job_id)
+        job.remote_job_id = 'slurm.00042'
+    with store:
+        assert store.get_job_version(job_id) == version + 1
+        job = store.get_job(job_id)
+        assert job.try_transition(JobState.SUBMITTED, JobState.STAGING_IN)
+        assert store.get_job_version(job_id) == version + 2
+        assert not job.try_transition(JobState.SUBMITTED, JobState.STAGING_IN)
+        assert store.get_job_version(job_id) == version + 2
+
+    onejob_store['conn'].execute("""
+        UPDATE jobs SET state = state, remote_job_id = remote_job_id""")
+    onejob_store['conn'].commit()
+    with store:
+        assert store.get_job_version(job_id) == version + 2
+        job = store.get_job(job_id)
+        job.remote_job_id = 'slurm.00042'
+    with store:
+        assert store.get_job_version(job_id) == version + 2
+
+def test_store_apply_event(empty_store):
+    store = empty_store['store']
+    with store:
+        job_ids = store.create_jobs([('test_store_apply_event', 'file:///1', '{}')] * 3)
+        store.get_job(job_ids[0]).state = JobState.WAITING
+        store.get_job(job_ids[1]).state = JobState.RUNNING_CR
+        assert store.apply_event(JobEvent.REMOTE_DONE, job_ids=job_ids) == 2
+        states = [store.get_job(job_id).state for job_id in job_ids]
+        assert states == [JobState.FINISHED, JobState.CANCELLED, JobState.SUBMITTED]
+
+def test_cancel_jobs(empty_store):
+    store = empty_store['store']
+    with store:
+        job_ids = store.create_jobs([('test_cancel_jobs', 'file:///1', '{}')] * 3)
+        store.get_job(job_ids[1]).state = JobState.RUNNING
+        store.get_job(job_ids[2]).state = JobState.SUCCESS
+
+    with store:
+        assert store.cancel_jobs(name='test_cancel_jobs') == 2
+        assert store.cancel_jobs(name='test_cancel_jobs') == 0
+        assert store.get_job(job_ids[1]).state == JobState.RUNNING_CR
+
+    with store:
+        states = [job.state for job in store.list_jobs()]
+        assert states == [JobState.CANCELLED, JobState.RUNNING_CR, JobState.SUCCESS]
+
+def test_cancel_jobs_filtered(empty_store):
+    store = empty_store['store']
+    with store:
+        job_ids = store.create_jobs([('test_cancel_jobs_filtered', 'file:///1', '{}')] * 3)
+        store.get_job(job_ids[2]).state = JobState.WAITING
+
+    with store:
+        assert store.cancel_jobs(job_ids=job_ids[1:]) == 2
+        assert store.cancel_jobs(job_ids=[]) == 0
+        assert store.cancel_jobs(states=[]) == 0
+        assert store.delete_jobs(states=[]) == 0
+        assert store.cancel_jobs(states=[JobState.SUBMITTED], name='x') == 0
+        states = [job.state for job in store.list_jobs()]
+        assert states == [JobState.SUBMITTED, JobState.CANCELLED, JobState.WAITING_CR]
+
+def test_delete_jobs(empty_store):
+    store = empty_store['store']
+    with store:
+        job_ids = store.create_jobs([('test_delete_jobs', 'file:///1', '{}')] * 2)
+        store.get_job(job_ids[1]).state = JobState.SUCCESS
+
+    with store:
+        assert store.delete_jobs(states=[JobState.SUBMITTED, JobState.SUCCESS]) == 2
+
+    with store:
+        jobs = store.list_jobs(please_delete=True)
+        assert [job.state for job in jobs] == [JobState.CANCELLED, JobState.SUCCESS]
+
+def test_cancel_many_jobs(empty_store):
+    store = empty_store['store']
+    with store:
+        job_ids = store.create_jobs([('test_cancel_many_jobs', 'file:///1', '{}')] * 2000)
+
+    with store:
+        assert store.cancel_jobs(job_ids=job_ids) == 2000
+        assert len(store.list_job_versions(states=[JobState.CANCELLED])) == 2000
+
+def test_list_jobs_by_id(empty_store):
+    store = empty_store['store']
+    with store:
+        job_ids = store.create_jobs([('test_list_jobs_by_id', 'file:///1', '{}')] * 2000)
+
+    with store:
+        assert store.list_jobs(job_ids=[]) == []
+        joblist = store.list_jobs(job_ids=[job_ids[2], 'nonexistent', job_ids[1]])
+        assert [job.id for job in joblist] == job_ids[1:3]
+        joblist = store.list_jobs(job_ids=reversed(job_ids), offset=5, limit=1000)
+        assert [job.id for job in joblist] == job_ids[5:1005]
+        versions = store.list_job_versions(job_ids=job_ids[1000:])
+        assert [job_id for job_id, _ in versions] == job_ids[1000:]
+
 def test_get_job(onejob_store):
     with onejob_store['store']:
         job = onejob_store['store'].get_job('258685677b034756b55bbad161b2b89b')
@@ -141,6 +317,23 @@ def test_state_transitions(job):
     assert job.try_transition(JobState.STAGING_IN, JobState.STAGING_IN_CR)
     assert job.state == JobState.STAGING_IN_CR
 
+def test_apply_event(job):
+    assert not job.apply_event(JobEvent.START)
+    assert job.apply_event(JobEvent.PICK_UP)
+    assert job.state == JobState.STAGING_IN
+    assert job.apply_event(JobEvent.CANCEL)
+    assert job.state == JobState.STAGING_IN_CR
+    assert job.apply_event(JobEvent.START)
+    assert job.state == JobState.WAITING_CR
+
+def test_loaded_apply_event(onejob_store, job):
+    job.load()
+    onejob_store['conn'].execute("""
+        UPDATE jobs SET state = 'FINISHED' WHERE job_id = ?""", (job.id,))
+    onejob_store['conn'].commit()
+    assert job.apply_event(JobEvent.PICK_UP)
+    assert job.state == JobState.STAGING_OUT
+
 def test_set_get_log(job):
     test_log = """This is a test log
         With newlines.
@@ -148,6 +341,42 @@ def test_set_get_log(job):
     job.log = test_log
     assert job.log == test_log
 
+def test_append_read_log(job):
+    job.log = 'Step 1\n'
+    job.append_log('Step 2 \u00e9\n')
+    job.append_log('')
+    job.append_log('Step 3\n')
+    assert job.log == 'Step 1\nStep 2 \u00e9\nStep 3\n'
+    assert job.log_size == 24
+    assert job.read_log(5) == 'Step 1\nStep 2 \u00e9\nStep 3\n'.encode('utf-8')[5:]
+    assert job.read_log(5, 5) == b'1\nSte'
+    assert job.read_log(7, 9) == 'Step 2 \u00e9'.encode('utf-8')
+    assert job.read_log(30) == b''
+    job.log = 'Restarted'
+    assert job.log == 'Restarted'
+
+def test_store_read_log(onejob_store, job):
+    store = onejob_store['store']
+    job.log = 'Step 1\n'
+    job.append_log('Step 2\n')
+    assert store.log_size(job.id) == 14
+    assert store.read_log(job.id) == b'Step 1\nStep 2\n'
+    assert store.read_log(job.id, 5, 9) == b'1\nSt'
+    assert store.read_log(job.id, 14, 20) == b''
+    assert store.log_size('nonexistent') == 0
+    assert store.read_log('nonexistent', 0, 10) == b''
+
+def test_migrate_log(onejob_db):
+    onejob_db['conn'].execute("""UPDATE jobs SET log = 'Old log'""")
+    onejob_db['conn'].commit()
+    store = SQLiteJobStore(onejob_db['file'])
+    with store:
+        job = store.get_job('258685677b034756b55bbad161b2b89b')
+        assert job.log == 'Old log'
+        store.delete_job(job.id)
+    res = onejob_db['conn'].execute("""SELECT COUNT(*) FROM job_logs""")
+    assert res.fetchone()[0] == 0
+
 def test_set_get_output(job):
     test_output = WcJob.remote_output('')
     job.output = test_output
@@ -157,6 +386,11 @@ def test_set_get_workflow_content(job):
     job.workflow_content = WcJob.workflow
     assert job.workflow_content == WcJob.workflow
 
+def test_set_get_workflow_json(job):
+    assert job.workflow_json is None
+    job.workflow_json = '{"class": "Workflow"}'
+    assert job.workflow_json == '{"class": "Workflow"}'
+
 def test_set_get_remote_workdir_path(job):
     job.remote_workdir_path = '/test_set_get'
     assert job.remote_workdir_path == '/test_set_get'
@@ -185,3 +419,161 @@ def test_set_get_remote_job_id(job):
     job.remote_job_id = 'slurm.00042'
     assert job.remote_job_id == 'slurm.00042'
 
+def test_load_job(onejob_store, job):
+    job.load()
+    onejob_store['conn'].execute("""
+        UPDATE jobs SET name = 'changed' WHERE job_id = ?""", (job.id,))
+    onejob_store['conn'].commit()
+    assert job.name == 'test_sqlite_job_store'
+    assert job.state == JobState.SUBMITTED
+    job.load()
+    assert job.name == 'changed'
+
+def test_save_loaded_job(onejob_store, job):
+    job.load()
+    job.remote_workdir_path = '/test_save'
+    job.remote_job_id = 'slurm.00042'
+    assert job.remote_workdir_path == '/test_save'
+    res = job._store._thread_local_data.conn.execute("""
+        SELECT remote_job_id FROM jobs WHERE job_id = ?""", (job.id,))
+    assert res.fetchone()[0] is None
+    job.save()
+    res = job._store._thread_local_data.conn.execute("""
+        SELECT remote_workdir_path, remote_job_id FROM jobs WHERE job_id = ?""",
+        (job.id,))
+    assert res.fetchone() == ('/test_save', 'slurm.00042')
+
+def test_loaded_state_transitions(onejob_store, job):
+    job.load()
+    onejob_store['conn'].execute("""
+        UPDATE jobs SET state = 'CANCELLED' WHERE job_id = ?""", (job.id,))
+    onejob_store['conn'].commit()
+    assert not job.try_transition(JobState.SUBMITTED, JobState.STAGING_IN)
+    assert job.state == JobState.CANCELLED
+    assert job.try_transition(JobState.CANCELLED, JobState.SUBMITTED)
+    assert job.state == JobState.SUBMITTED
+
+def test_unit_of_work_commit(onejob_store):
+    store = onejob_store['store']
+    with store:
+        job = store.get_job('258685677b034756b55bbad161b2b89b')
+        with store:
+            assert store.get_job('258685677b034756b55bbad161b2b89b') is job
+            job.remote_workdir_path = '/test_unit_of_work'
+        job.remote_job_id = 'slurm.00042'
+        res = onejob_store['conn'].execute("""
+            SELECT remote_workdir_path FROM jobs WHERE job_id = ?""", (job.id,))
+        assert res.fetchone()[0] is None
+
+    res = onejob_store['conn'].execute("""
+        SELECT remote_workdir_path, remote_job_id FROM jobs WHERE job_id = ?""",
+        ('258685677b034756b55bbad161b2b89b',))
+    assert res.fetchone() == ('/test_unit_of_work', 'slurm.00042')
+
+def test_unit_of_work_rollback(onejob_store):
+    store = onejob_store['store']
+    with pytest.raises(RuntimeError):
+        with store:
+            job = store.get_job('258685677b034756b55bbad161b2b89b')
+            job.remote_job_id = 'slurm.00042'
+            store.create_job('test_unit_of_work_rollback', 'file:///', '{}')
+            raise RuntimeError()
+
+    res = onejob_store['conn'].execute("""SELECT remote_job_id FROM jobs""")
+    assert res.fetchall() == [(None,)]
+
+def test_migrate_existing_store(onejob_db):
+    store = SQLiteJobStore(onejob_db['file'])
+    conn = sqlite3.connect(onejob_db['file'])
+    assert conn.execute('PRAGMA user_version').fetchone()[0] >= 1
+    indexes = [row[1] for row in conn.execute("PRAGMA index_list('jobs')")]
+    assert 'jobs_state_idx' in indexes
+    assert 'jobs_please_delete_idx' in indexes
+    assert 'jobs_name_idx' in indexes
+    plan = conn.execute("""
+        EXPLAIN QUERY PLAN SELECT * FROM jobs WHERE job_id = ?""",
+        ('258685677b034756b55bbad161b2b89b',)).fetchall()
+    assert 'SCAN' not in str(plan)
+    with store:
+        assert store.get_job('258685677b034756b55bbad161b2b89b').name == 'test_sqlite_job_store'
+    # opening again must not migrate twice
+    _ = SQLiteJobStore(onejob_db['file'])
+
+def test_change_count(onejob_store):
+    store = onejob_store['store']
+    with store:
+        count = store.get_change_count()
+        job = store.get_job('258685677b034756b55bbad161b2b89b')
+        job.try_transition(JobState.SUBMITTED, JobState.STAGING_IN)
+        assert store.get_change_count() == count + 1
+        job.remote_job_id = 'slurm.00042'
+        store.create_job('test_change_count', 'file:///', '{}')
+    with store:
+        assert store.get_change_count() == count + 2
+
+def test_change_count_unchanged_value(onejob_store):
+    store = onejob_store['store']
+    job_id = '258685677b034756b55bbad161b2b89b'
+    with store:
+        count = store.get_change_count()
+        job = store.get_job(job_id)
+        for _ in range(3):
+            job.state = JobState.SUBMITTED
+            job.save()
+    onejob_store['conn'].execute("""
+        UPDATE jobs SET state = state, please_delete = please_delete""")
+    onejob_store['conn'].commit()
+    with store:
+        assert store.get_change_count() == count
+
+def test_wait_for_change(onejob_store):
+    store = onejob_store['store']
+    with store:
+        count = store.get_change_count()
+    assert store.wait_for_change(count, 0.1) == count
+
+    with store:
+        store.create_job('test_wait_for_change', 'file:///', '{}')
+    start = time.perf_counter()
+    assert store.wait_for_change(count, 10.0) == count + 1
+    assert time.perf_counter() - start < 1.0
+
+def test_connection_pool_threads(onejob_store):
+    store = onejob_store['store']
+    with store:
+        store.get_job('258685677b034756b55bbad161b2b89b')
+
+    # a different thread gets the pooled connection
+    errors = []
+    def get_job():
+        try:
+            with store:
+                store.get_job('258685677b034756b55bbad161b2b89b')
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=get_job)
+    thread.start()
+    thread.join()
+    assert errors == []
+
+def test_wait_for_job_change(onejob_store):
+    store = onejob_store['store']
+    job_id = '258685677b034756b55bbad161b2b89b'
+    with store:
+        version = store.get_job_version(job_id)
+    assert store.wait_for_job_change(job_id, version, 0.1) == version
+
+    def cancel():
+        time.sleep(0.1)
+        with store:
+            store.get_job(job_id).try_transition(JobState.SUBMITTED, JobState.CANCELLED)
+
+    canceller = threading.Thread(target=cancel)
+    canceller.start()
+    start = time.perf_counter()
+    assert store.wait_for_job_change(job_id, version, 10.0) == version + 1
+    assert time.perf_counter() - start < 1.0
+    canceller.join()
+
+    assert store.wait_for_job_change('nonexistent', 0, 10.0) is None
@@ -0,0 +1,35 @@
+import json
+import yaml
+
+try:
+    _SafeLoader = yaml.CSafeLoader
+    """The fastest safe YAML loader available."""
+except AttributeError:
+    _SafeLoader = yaml.SafeLoader
+
+def load_yaml(document):
+    """Parse a YAML document, such as a CWL file or a configuration
+    file.
+
+    JSON is a subset of YAML, and many documents we get (translated
+    workflows, files generated by tools) are in fact JSON, so this
+    tries the much faster JSON parser first. Otherwise, the document
+    is parsed with the libyaml-based loader if PyYAML was built with
+    it, and with the pure Python one if not.
+
+    Args:
+        document (Union[str, bytes, TextIO]): The document to parse,
+            or an open file to read it from.
+
+    Returns:
+        Any: The parsed document.
+    """
+    if hasattr(document, 'read'):
+        document = document.read()
+    try:
+        # json.loads() only accepts bytes from Python 3.6 on
+        if isinstance(document, bytes):
+            return json.loads(document.decode('utf-8'))
+        return json.loads(document)
+    except ValueError:
+        return yaml.load(document, Loader=_SafeLoader)
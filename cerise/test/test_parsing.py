@@ -0,0 +1,26 @@
+from cerise.parsing import load_yaml
+
+import io
+
+def test_load_yaml():
+    document = """
+        cwlVersion: v1.0
+        class: Workflow
+        inputs: []
+        steps: { step: { run: test/wc.cwl } }
+        """
+    workflow = load_yaml(document)
+    assert workflow['class'] == 'Workflow'
+    assert workflow['steps']['step']['run'] == 'test/wc.cwl'
+
+def test_load_json():
+    document = b'{"class": "Workflow", "inputs": [], "version": 1.0}'
+    assert load_yaml(document) == {'class': 'Workflow', 'inputs': [], 'version': 1.0}
+
+def test_load_non_utf8_yaml():
+    document = 'key: välue\n'.encode('utf-16')
+    assert load_yaml(document) == {'key': 'välue'}
+
+def test_load_file():
+    document = io.StringIO('key: value\n')
+    assert load_yaml(document) == {'key': 'value'}